@@ -1,9 +1,13 @@
+from core.page_cache import cached_page
+from django.utils.decorators import method_decorator
 from django.views.generic.base import TemplateView
 
 
+@method_decorator(cached_page(punch_holes=True), name='dispatch')
 class Author(TemplateView):
     template_name = 'about/author.html'
 
 
+@method_decorator(cached_page(punch_holes=True), name='dispatch')
 class Tech(TemplateView):
     template_name = 'about/tech.html'
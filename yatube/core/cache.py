@@ -0,0 +1,151 @@
+import os
+import tempfile
+import uuid
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+
+from core import metrics
+
+_missing = object()
+
+
+class TwoTierCache(BaseCache):
+    """Кеш из двух уровней: L1 в памяти процесса и общий L2.
+
+    Чтение сначала идёт в L1, промах дочитывается из L2 и кладётся
+    в L1 на L1_TIMEOUT секунд. Запись и удаление идут в оба уровня,
+    так что чужой процесс видит изменения не позже чем через
+    L1_TIMEOUT. Ключи с префиксами из SHARED_ONLY (ключи версий)
+    читаются только из L2: смена версии сразу видна всем процессам,
+    а закешированное под версией содержимое можно спокойно держать
+    в L1.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l1_alias = options.get('L1', 'local')
+        self._l2_alias = options.get('L2', 'shared')
+        self.l1_timeout = options.get('L1_TIMEOUT', 10)
+        self.shared_only = tuple(options.get('SHARED_ONLY', ()))
+
+    @property
+    def l1(self):
+        return caches[self._l1_alias]
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _l1_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def _in_l1(self, key):
+        return not key.startswith(self.shared_only)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version)
+        if added and self._in_l1(key):
+            self.l1.set(key, value, self._l1_timeout(timeout), version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        if self._in_l1(key):
+            value = self.l1.get(key, _missing, version)
+            if value is not _missing:
+                metrics.record_cache(hit=True)
+                return value
+        value = self.l2.get(key, _missing, version)
+        metrics.record_cache(hit=value is not _missing)
+        if value is _missing:
+            return default
+        if self._in_l1(key):
+            self.l1.set(key, value, self.l1_timeout, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        if self._in_l1(key):
+            self.l1.set(key, value, self._l1_timeout(timeout), version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self.l1.delete(key, version)
+        self.l2.delete(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version)
+        if self._in_l1(key):
+            self.l1.set(key, value, self.l1_timeout, version)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, _missing, version) is not _missing
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+
+class AtomicFileBasedCache(FileBasedCache):
+    """Файловый кеш, в котором add() атомарен и между процессами.
+
+    У FileBasedCache add() — это has_key() и set(): несколько
+    процессов могут одновременно «взять» одну блокировку. Здесь файл
+    записи сначала пишется целиком во временный файл, а затем
+    жёсткой ссылкой появляется под своим именем: link() не
+    перезаписывает существующий файл, поэтому выигрывает ровно один.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    if not self._remove_expired(fname):
+                        return False
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def _remove_expired(self, fname):
+        """Убирает истёкшую запись, не задев свежую чужую.
+
+        Файл сначала уводится под временное имя: если за это время
+        его успел заменить другой процесс свежей записью, запись
+        возвращается на место.
+        """
+        moved = f'{fname}.{uuid.uuid4().hex}.expired'
+        try:
+            os.rename(fname, moved)
+        except FileNotFoundError:
+            return True
+        try:
+            with open(moved, 'rb') as f:
+                expired = self._is_expired(f)
+            if not expired:
+                try:
+                    os.link(moved, fname)
+                except FileExistsError:
+                    pass
+            return expired
+        finally:
+            if os.path.exists(moved):
+                os.remove(moved)
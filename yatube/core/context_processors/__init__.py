@@ -0,0 +1,48 @@
+import time
+from datetime import date, datetime, timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+
+def today():
+    if settings.USE_TZ:
+        return timezone.localdate()
+    return date.today()
+
+
+def next_midnight(day):
+    """Момент начала следующих суток, секунды эпохи."""
+    midnight = datetime.combine(day + timedelta(days=1), datetime.min.time())
+    if settings.USE_TZ:
+        midnight = timezone.make_aware(midnight)
+    return midnight.timestamp()
+
+
+def daily(name):
+    """Превращает compute(today) в контекстный процессор с переменной name.
+
+    Значение считается один раз в сутки: до полуночи (в TIME_ZONE)
+    процессор отдаёт запомненное. В контекст оно попадает как
+    SimpleLazyObject, поэтому шаблоны, где переменной нет, не платят
+    даже за проверку даты.
+    """
+    def decorator(compute):
+        memo = (0, None)
+
+        def value():
+            nonlocal memo
+            expires, cached = memo
+            if time.time() >= expires:
+                day = today()
+                cached = compute(day)
+                memo = (next_midnight(day), cached)
+            return cached
+
+        @wraps(compute)
+        def processor(request):
+            return {name: SimpleLazyObject(value)}
+        return processor
+    return decorator
@@ -1,5 +1,7 @@
 from datetime import date
 
+from core.context_processors import daily
+
 
 def add_prefix(age):
     if age % 10 == 1 and age != 11:
@@ -10,11 +12,9 @@ def add_prefix(age):
         return f'{age} лет'
 
 
-def my_age(request):
+@daily('age')
+def my_age(today):
     """Возвращает мой возраст в годах."""
     birthday = date(1992, 12, 13)
-    today = date.today()
     difference = (today - birthday).days // 365
-    return {
-        'age': add_prefix(difference),
-    }
+    return add_prefix(difference)
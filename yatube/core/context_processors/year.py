@@ -1,9 +1,7 @@
-from django.utils import timezone
+from core.context_processors import daily
 
 
-def year(request):
+@daily('year')
+def year(today):
     """Добавляет переменную с текущим годом."""
-    year = timezone.now().year
-    return {
-        'year': year,
-    }
+    return today.year
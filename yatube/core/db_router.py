@@ -0,0 +1,53 @@
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+
+
+def start_request(pinned=False):
+    """Начинает маршрутизацию запроса: с реплик читаем только внутри него.
+
+    pinned — читать с основной базы (пользователь недавно писал).
+    Одна реплика на весь запрос, чтобы страница была согласованной.
+    """
+    _state.active = True
+    _state.pinned = pinned
+    _state.wrote = False
+    _state.replica = (
+        random.choice(settings.DATABASE_REPLICAS)
+        if settings.DATABASE_REPLICAS else DEFAULT_DB_ALIAS
+    )
+
+
+def end_request():
+    """Завершает запрос и сообщает, была ли в нём запись."""
+    wrote = getattr(_state, 'wrote', False)
+    _state.active = False
+    return wrote
+
+
+class PrimaryReplicaRouter:
+    """Чтение с реплик, запись и чтение после записи — с основной базы.
+
+    Вне запросов (management-команды, фоновые потоки) всё идёт
+    в основную базу: там нет задержки репликации.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (not getattr(_state, 'active', False) or _state.pinned
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return _state.replica
+
+    def db_for_write(self, model, **hints):
+        if getattr(_state, 'active', False):
+            _state.pinned = True
+            _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в основной базе
+        return True
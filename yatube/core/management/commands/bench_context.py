@@ -0,0 +1,51 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.template import Engine
+from django.test import RequestFactory
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет, сколько стоит построение контекста шаблона на один '
+        'запрос: все контекстные процессоры и каждый по отдельности'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=10000,
+            help='Сколько раз построить контекст',
+        )
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        processors = Engine.get_default().template_context_processors
+
+        self.stdout.write(f'{"":<52} {"построение":>12} {"с чтением":>12}')
+        totals = [0, 0]
+        for processor in processors:
+            label = f'{processor.__module__}.{processor.__name__}'
+            timings = [
+                self.measure(processor, request, count, resolve)
+                for resolve in (False, True)
+            ]
+            totals = [total + timing for total, timing in zip(totals, timings)]
+            self.write(label, timings)
+        self.write('всего на запрос', totals)
+
+    def measure(self, processor, request, count, resolve):
+        """Микросекунд на вызов; resolve — ещё и прочитать значения."""
+        started = time.perf_counter()
+        for _ in range(count):
+            context = processor(request)
+            if resolve:
+                for value in context.values():
+                    str(value)
+        return (time.perf_counter() - started) / count * 1e6
+
+    def write(self, label, timings):
+        self.stdout.write(
+            f'{label:<52} ' + ' '.join(f'{t:8.2f} мкс' for t in timings))
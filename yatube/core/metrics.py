@@ -0,0 +1,187 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+from django.template.backends.django import DjangoTemplates, Template
+
+# Границы корзин гистограмм, как le в Prometheus
+SECONDS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+HISTOGRAMS = {
+    'yatube_request_duration_seconds': (
+        'Время ответа view целиком', SECONDS_BUCKETS),
+    'yatube_db_queries': (
+        'SQL-запросов за один ответ', QUERIES_BUCKETS),
+    'yatube_db_duration_seconds': (
+        'Время SQL-запросов за один ответ', SECONDS_BUCKETS),
+    'yatube_template_render_seconds': (
+        'Время отрисовки шаблонов за один ответ', SECONDS_BUCKETS),
+}
+CACHE_COUNTER = 'yatube_cache_requests_total'
+
+_local = threading.local()
+
+
+class RequestStats:
+    """Счётчики одного запроса, которые копятся по ходу его обработки."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def current():
+    """Статистика запроса, который обрабатывает этот поток, или None."""
+    return getattr(_local, 'stats', None)
+
+
+def start_request():
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def end_request():
+    return _local.__dict__.pop('stats', None)
+
+
+def record_cache(hit):
+    stats = current()
+    if stats is None:
+        return
+    if hit:
+        stats.cache_hits += 1
+    else:
+        stats.cache_misses += 1
+
+
+def record_template(seconds):
+    stats = current()
+    if stats is not None:
+        stats.template_time += seconds
+
+
+def time_query(execute, sql, params, many, context):
+    """execute_wrapper: считает запросы и их время без DEBUG."""
+    stats = current()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Гистограммы и счётчики по имени view в памяти процесса.
+
+    У каждого воркера WSGI-сервера свой реестр, поэтому Prometheus
+    должен опрашивать воркеры по отдельности (или сервер запускается
+    с одним воркером на порт).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.histograms = defaultdict(dict)
+            self.counters = defaultdict(int)
+
+    def observe(self, stats, view, duration):
+        values = {
+            'yatube_request_duration_seconds': duration,
+            'yatube_db_queries': stats.queries,
+            'yatube_db_duration_seconds': stats.db_time,
+            'yatube_template_render_seconds': stats.template_time,
+        }
+        with self._lock:
+            for name, value in values.items():
+                by_view = self.histograms[name]
+                if view not in by_view:
+                    by_view[view] = Histogram(HISTOGRAMS[name][1])
+                by_view[view].observe(value)
+            self.counters[(view, 'hit')] += stats.cache_hits
+            self.counters[(view, 'miss')] += stats.cache_misses
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus 0.0.4."""
+        lines = []
+        with self._lock:
+            for name, (help_text, buckets) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for view, histogram in sorted(self.histograms[name].items()):
+                    label = f'view="{escape(view)}"'
+                    total = 0
+                    for bound, count in zip(
+                            buckets + ('+Inf',), histogram.counts):
+                        total += count
+                        lines.append(
+                            f'{name}_bucket{{{label},le="{bound}"}} {total}')
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.count}')
+            lines.append(f'# HELP {CACHE_COUNTER} Обращения к кешу')
+            lines.append(f'# TYPE {CACHE_COUNTER} counter')
+            for (view, result), value in sorted(self.counters.items()):
+                lines.append(
+                    f'{CACHE_COUNTER}{{view="{escape(view)}",'
+                    f'result="{result}"}} {value}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+registry = Registry()
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            record_template(time.perf_counter() - started)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблонизатор Django, который замеряет время отрисовки.
+
+    Замеряются только шаблоны верхнего уровня (render,
+    render_to_string): include и extends рисуются внутри них.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template,
+                             self)
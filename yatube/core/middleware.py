@@ -0,0 +1,117 @@
+import cProfile
+import os
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.middleware.clickjacking import XFrameOptionsMiddleware
+from django.urls import resolve
+
+from core import db_router, metrics, page_cache
+
+PIN_COOKIE = 'db_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PrimaryReplicaMiddleware:
+    """Направляет чтение запроса на реплику или на основную базу.
+
+    После запроса с записью пользователь ещё REPLICA_PIN_SECONDS
+    читает с основной базы (по cookie), чтобы сразу видеть
+    свой пост, комментарий или подписку, даже если реплика отстаёт.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Соединения, давшие ошибку или пережившие CONN_MAX_AGE, Django
+        # сам закрывает по сигналу request_started, не опрашивая
+        # исправные: запрос из кеша страниц не ходит в базу
+        db_router.start_request(
+            pinned=(request.method not in SAFE_METHODS
+                    or PIN_COOKIE in request.COOKIES)
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = db_router.end_request()
+        if wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+class AnonymousPageMiddleware:
+    """Отдаёт анонимам страницы из кеша cached_page.
+
+    Стоит до сессий, auth и CSRF: запросу без cookie сессии они
+    не нужны, ответ берётся из кеша целиком.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.PAGE_CACHE_ENABLED and page_cache.is_anonymous(request):
+            page = page_cache.get_page(request)
+            if page:
+                # Чтобы MetricsMiddleware учёл ответ под именем view
+                request.resolver_match = resolve(request.path_info)
+                response = page_cache.page_response(request, *page)
+                # XFrameOptionsMiddleware стоит ниже и его не пройти
+                return XFrameOptionsMiddleware().process_response(
+                    request, response)
+        return self.get_response(request)
+
+
+class MetricsMiddleware:
+    """Собирает метрики каждого ответа по имени view.
+
+    Число и время SQL-запросов, время отрисовки шаблонов, попадания
+    и промахи кеша и общее время ответа попадают в гистограммы
+    core.metrics.registry, которые отдаёт /metrics. Доля
+    METRICS_PROFILE_RATE запросов профилируется cProfile, дампы
+    складываются в METRICS_PROFILE_DIR.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = metrics.start_request()
+        profiler = None
+        if random.random() < settings.METRICS_PROFILE_RATE:
+            profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.time_query))
+                if profiler is not None:
+                    profiler.enable()
+                    stack.callback(profiler.disable)
+                response = self.get_response(request)
+        finally:
+            metrics.end_request()
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.registry.observe(stats, view, duration)
+        if profiler is not None:
+            dump_profile(profiler, view)
+        return response
+
+
+def dump_profile(profiler, view):
+    os.makedirs(settings.METRICS_PROFILE_DIR, exist_ok=True)
+    name = f'{view.replace(":", ".")}-{time.time_ns()}.prof'
+    profiler.dump_stats(os.path.join(settings.METRICS_PROFILE_DIR, name))
@@ -0,0 +1,171 @@
+import base64
+import hashlib
+import json
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+
+PAGE_VERSION_KEY = 'pages:version'
+
+# Версия страниц, зависящих от одного объекта, например автора
+SCOPE_VERSION_KEY = 'pages:version:{}'
+
+PAGE_KEY = 'pages:page:{}'
+
+HOLE_START = '<!--hole:{}-->'
+HOLE_END = '<!--/hole-->'
+HOLE_RE = re.compile(r'<!--hole:([\w=-]+)-->.*?<!--/hole-->', re.DOTALL)
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def page_version(scope=None):
+    """Текущая версия закешированных страниц, входит в каждую запись.
+
+    Со scope — версия только страниц, отмеченных depend_on(scope).
+    """
+    key = PAGE_VERSION_KEY if scope is None else SCOPE_VERSION_KEY.format(
+        scope)
+    return cache.get_or_set(key, _fresh_version, None)
+
+
+def bump_page_version(scope=None):
+    """Сбрасывает все закешированные страницы разом или только scope."""
+    key = PAGE_VERSION_KEY if scope is None else SCOPE_VERSION_KEY.format(
+        scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _fresh_version(), None)
+
+
+def depend_on(request, scope):
+    """Отмечает, что страница сбрасывается и bump_page_version(scope).
+
+    Версия scope запоминается в момент вызова, поэтому view зовёт
+    depend_on сразу, как узнала объект, до остальных запросов.
+    """
+    scopes = getattr(request, 'page_scopes', None)
+    if scopes is not None:
+        scopes[scope] = page_version(scope)
+
+
+def _fresh_version():
+    # Как у версии лент: после вытеснения ключа нельзя начать с 1
+    return int(time.time() * 1000)
+
+
+def page_key(request):
+    language = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
+    path = request.get_full_path()
+    return PAGE_KEY.format(
+        hashlib.md5(f'{language}|{path}'.encode()).hexdigest())
+
+
+def is_anonymous(request):
+    """Запрос без сессии и сообщений: ответ на него одинаков для всех."""
+    return (
+        request.method in SAFE_METHODS
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+
+
+def get_page(request):
+    """Запись (etag, content_type, body) текущей версии или None."""
+    entry = cache.get(page_key(request))
+    if entry is None or entry[0] != page_version():
+        return None
+    for scope, version in entry[1]:
+        if page_version(scope) != version:
+            return None
+    return entry[2:]
+
+
+def store_page(request, response, version):
+    """Кладёт ответ анонимному посетителю в кеш, если он общий для всех."""
+    if hasattr(response, 'render'):
+        # TemplateResponse view на классах рисуется только здесь
+        response.render()
+    if (response.status_code != 200
+            or response.streaming
+            or response.cookies
+            or request.META.get('CSRF_COOKIE_USED')):
+        return
+    etag = '"{}"'.format(hashlib.md5(response.content).hexdigest())
+    scopes = tuple(getattr(request, 'page_scopes', {}).items())
+    cache.set(
+        page_key(request),
+        (version, scopes, etag, response['Content-Type'], response.content),
+        settings.PAGE_CACHE_TIMER,
+    )
+    response['ETag'] = etag
+
+
+def page_response(request, etag, content_type, body):
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type=content_type)
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def encode_hole(template_name, args):
+    payload = json.dumps([template_name, args]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def fill_holes(body, request):
+    """Дорисовывает в общей странице фрагменты для пользователя."""
+    def fill(match):
+        template_name, args = json.loads(base64.urlsafe_b64decode(match[1]))
+        return render_to_string(template_name, args, request=request)
+
+    return HOLE_RE.sub(fill, body.decode()).encode()
+
+
+def cached_page(punch_holes=False):
+    """Кеширует страницу целиком, пока не сменится page_version.
+
+    Кеш наполняют анонимные посетители: их запросы без сессии
+    отдаёт из кеша AnonymousPageMiddleware ещё до сессий, auth и
+    CSRF. С punch_holes=True та же страница идёт и вошедшим
+    пользователям: личные части, отмеченные тегом {% hole %},
+    перерисовываются для них по отдельности. Страницы, где личного
+    больше, чем дырок, вошедшим рисуются обычным путём. Страницу,
+    отметившую depend_on(request, scope), сбрасывает и смена версии
+    этого scope.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (not settings.PAGE_CACHE_ENABLED
+                    or request.method not in SAFE_METHODS):
+                return view(request, *args, **kwargs)
+            if request.user.is_authenticated:
+                page = punch_holes and get_page(request)
+                if not page:
+                    return view(request, *args, **kwargs)
+                _, content_type, body = page
+                return HttpResponse(
+                    fill_holes(body, request), content_type=content_type)
+            page = get_page(request)
+            if page:
+                return page_response(request, *page)
+            version = page_version()
+            request.punch_holes = punch_holes
+            request.page_scopes = {}
+            response = view(request, *args, **kwargs)
+            store_page(request, response, version)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class LocMemCacheRunner(DiscoverRunner):
+    """Прогоняет тесты с общим кешем (L2) в памяти процесса.
+
+    Иначе тесты пишут в файловый кеш или Redis рабочего окружения
+    и видят записи предыдущих прогонов.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        shared = {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'shared',
+        }
+        self._caches = override_settings(
+            CACHES=dict(settings.CACHES, shared=shared))
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        super().teardown_test_environment(**kwargs)
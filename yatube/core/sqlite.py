@@ -0,0 +1,45 @@
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection as default_connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from core.middleware import SAFE_METHODS
+
+_writer_lock = threading.Lock()
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Настраивает каждое новое соединение с SQLite по SQLITE_PRAGMAS.
+
+    WAL позволяет читать во время записи, а busy_timeout заставляет
+    писателя подождать блокировку вместо ошибки database is locked.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+def single_writer(view):
+    """Пропускает view с записью в SQLite по одной за раз.
+
+    Потоки процесса ждут своей очереди на блокировке, а не
+    соревнуются за блокировку файла базы. Между процессами
+    очередь обеспечивает busy_timeout. GET, который только рисует
+    форму, в очереди не стоит. Выключается настройкой
+    SQLITE_SERIALIZE_WRITES.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (not settings.SQLITE_SERIALIZE_WRITES
+                or request.method in SAFE_METHODS
+                or default_connection.vendor != 'sqlite'):
+            return view(request, *args, **kwargs)
+        with _writer_lock:
+            return view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,30 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.page_cache import HOLE_END, HOLE_START, encode_hole
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name, **args):
+    """Личная часть страницы из кеша core.page_cache.cached_page.
+
+    {% hole 'includes/header.html' query=query %}
+
+    Рисуется как include с переданными аргументами. Когда страница
+    строится для кеша, фрагмент ещё и помечается, чтобы вошедшему
+    пользователю его перерисовать. Поэтому фрагмент может опираться
+    только на свои аргументы (простые значения) и на переменные
+    контекстных процессоров.
+    """
+    fragment = context.template.engine.get_template(template_name)
+    with context.push(**args):
+        content = fragment.render(context)
+    if not getattr(getattr(context, 'request', None), 'punch_holes', False):
+        return content
+    return mark_safe(
+        HOLE_START.format(encode_hole(template_name, args))
+        + content
+        + HOLE_END
+    )
@@ -1,6 +1,30 @@
+import os
+import tempfile
+import threading
+import time
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import connection, router, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse
+from django.template import Engine
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.utils.functional import SimpleLazyObject
+
+from core import db_router, metrics
+from core.cache import AtomicFileBasedCache
+from core.context_processors import daily
+from core.middleware import PIN_COOKIE, PrimaryReplicaMiddleware
+from core.sqlite import single_writer
+from core.warmup import warm_up_templates
 
 
 class ViewTestClass(TestCase):
@@ -9,3 +33,325 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class PrimaryReplicaRoutingTest(SimpleTestCase):
+    '''Чтение идёт с реплик, пока пользователь ничего не записал.'''
+
+    def request(self, method='get', cookies=None, write=False):
+        '''Прогоняет запрос через middleware, возвращает базы чтения.'''
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(User))
+            if write:
+                router.db_for_write(User)
+                reads.append(router.db_for_read(User))
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        response = PrimaryReplicaMiddleware(view)(request)
+        return reads, response
+
+    def test_read_from_replica(self):
+        reads, response = self.request()
+        self.assertEqual(reads, ['replica_1'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_write_pins_to_primary(self):
+        '''После записи чтение в запросе и следующих идёт с основной.'''
+        reads, response = self.request(write=True)
+        self.assertEqual(reads, ['replica_1', 'default'])
+        self.assertIn(PIN_COOKIE, response.cookies)
+        reads, _ = self.request(cookies={PIN_COOKIE: '1'})
+        self.assertEqual(reads, ['default'])
+
+    def test_post_reads_from_primary(self):
+        reads, _ = self.request(method='post')
+        self.assertEqual(reads, ['default'])
+
+    def test_outside_request_use_primary(self):
+        self.assertEqual(router.db_for_read(User), 'default')
+
+    def test_connections_not_pinged(self):
+        '''Исправные соединения не опрашиваются на каждом запросе.'''
+        with mock.patch.object(connection, 'connection', mock.Mock()), \
+                mock.patch.object(DatabaseWrapper, 'is_usable') as is_usable:
+            self.request()
+        is_usable.assert_not_called()
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class PrimaryInTransactionTest(TestCase):
+    def test_transaction_reads_from_primary(self):
+        '''Внутри транзакции чтение не уходит на отстающую реплику.'''
+        db_router.start_request()
+        try:
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(User), 'default')
+        finally:
+            db_router.end_request()
+
+
+class SqliteTuningTest(SimpleTestCase):
+    '''Настройка соединений SQLite и очередь писателей.'''
+
+    def test_pragmas_on_new_connection(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_settings = dict(
+                connection.settings_dict,
+                NAME=os.path.join(tmp_dir, 'db.sqlite3'),
+            )
+            file_connection = DatabaseWrapper(db_settings, alias='tmp')
+            try:
+                with file_connection.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], 5000)
+                    cursor.execute('PRAGMA synchronous')
+                    self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            finally:
+                file_connection.close()
+
+    def run_concurrently(self, method):
+        '''Сколько view с single_writer выполнялось одновременно.'''
+        running = []
+        overlaps = []
+
+        @single_writer
+        def view(request):
+            running.append(request)
+            overlaps.append(len(running))
+            time.sleep(0.01)
+            running.remove(request)
+
+        factory = RequestFactory()
+        threads = [
+            threading.Thread(
+                target=view, args=(factory.generic(method, '/'),))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return max(overlaps)
+
+    def test_single_writer_serializes_views(self):
+        '''Одновременно выполняется только одна view с записью.'''
+        self.assertEqual(self.run_concurrently('POST'), 1)
+
+    def test_single_writer_skips_safe_methods(self):
+        '''GET формы не ждёт писателей.'''
+        self.assertGreater(self.run_concurrently('GET'), 1)
+
+
+def two_tier(l1):
+    return {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'OPTIONS': {
+            'L1': l1,
+            'L2': 'shared',
+            'L1_TIMEOUT': 10,
+            'SHARED_ONLY': ('version:',),
+        },
+    }
+
+
+@override_settings(CACHES={
+    # Два «процесса» со своими L1 и общим L2
+    'default': two_tier('local_a'),
+    'other': two_tier('local_b'),
+    'local_a': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'a'},
+    'local_b': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'b'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+               'LOCATION': 'shared'},
+})
+class TwoTierCacheTest(SimpleTestCase):
+    '''Двухуровневый кеш: L1 в процессе и общий L2.'''
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.other = caches['other']
+        self.cache.clear()
+        self.other.clear()
+
+    def test_values_shared_through_l2(self):
+        self.cache.set('key', 'value')
+        self.assertEqual(self.other.get('key'), 'value')
+        self.assertEqual(caches['local_b'].get('key'), 'value')
+
+    def test_l1_serves_until_timeout(self):
+        '''Чужой процесс видит старое значение из своего L1.'''
+        self.cache.set('key', 'old')
+        self.other.get('key')
+        self.cache.set('key', 'new')
+        self.assertEqual(self.other.get('key'), 'old')
+        caches['local_b'].clear()
+        self.assertEqual(self.other.get('key'), 'new')
+
+    def test_version_keys_bypass_l1(self):
+        '''Смена версии сразу видна всем процессам.'''
+        self.cache.set('version:feed', 1)
+        self.assertEqual(self.other.get('version:feed'), 1)
+        self.cache.incr('version:feed')
+        self.assertEqual(self.other.get('version:feed'), 2)
+        self.assertIsNone(caches['local_a'].get('version:feed'))
+
+    def test_delete_and_get_or_set(self):
+        self.assertEqual(self.cache.get_or_set('key', 'value'), 'value')
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertFalse(self.cache.has_key('key'))
+
+
+class AtomicFileBasedCacheTest(SimpleTestCase):
+    '''add() файлового кеша выигрывает ровно один из конкурентов.'''
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def backend(self):
+        # У каждого «процесса» свой экземпляр поверх общего каталога
+        return AtomicFileBasedCache(self.dir.name, {})
+
+    def test_concurrent_add_has_single_winner(self):
+        results = []
+        barrier = threading.Barrier(8)
+
+        def add():
+            backend = self.backend()
+            barrier.wait()
+            results.append(backend.add('lock', True, 30))
+
+        threads = [threading.Thread(target=add) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+
+    def test_add_replaces_only_expired_entry(self):
+        backend = self.backend()
+        self.assertTrue(backend.add('lock', 'first', 30))
+        self.assertFalse(backend.add('lock', 'second', 30))
+        self.assertEqual(backend.get('lock'), 'first')
+
+        backend.set('lock', 'expired', -1)
+        self.assertTrue(backend.add('lock', 'third', 30))
+        self.assertEqual(backend.get('lock'), 'third')
+        self.assertEqual(os.listdir(self.dir.name), [
+            os.path.basename(backend._key_to_file('lock'))])
+
+
+class TestCachesTest(SimpleTestCase):
+    def test_shared_cache_in_memory(self):
+        '''Тесты не пишут в общий кеш рабочего окружения.'''
+        self.assertIsInstance(caches['shared'], LocMemCache)
+
+
+class MetricsTest(TestCase):
+    '''Метрики ответов копятся по view и отдаются на /metrics.'''
+
+    def setUp(self):
+        metrics.registry.clear()
+        cache.clear()
+
+    def test_view_metrics_exposed(self):
+        self.client.get('/about/author/')
+        self.client.get('/')
+        self.client.get('/')
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            text)
+        self.assertIn(
+            'yatube_db_queries_count{view="about:author"} 1', text)
+        self.assertIn('# TYPE yatube_template_render_seconds histogram', text)
+        self.assertIn(
+            'yatube_cache_requests_total{view="posts:index",result="hit"}',
+            text)
+        template_time = metrics.registry.histograms[
+            'yatube_template_render_seconds']['about:author'].sum
+        self.assertGreater(template_time, 0)
+
+    def test_queries_counted_without_debug(self):
+        User.objects.create(username='metrics')
+        self.client.get('/profile/metrics/')
+        histogram = metrics.registry.histograms[
+            'yatube_db_queries']['posts:profile']
+        self.assertEqual(histogram.count, 1)
+        self.assertGreater(histogram.sum, 0)
+
+    def test_metrics_hidden_from_other_ips(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_sampled_requests_profiled(self):
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with self.settings(METRICS_PROFILE_RATE=1,
+                               METRICS_PROFILE_DIR=profile_dir):
+                self.client.get('/about/tech/')
+            self.assertEqual(
+                os.listdir(profile_dir)[0].split('-')[0], 'about.tech')
+
+
+class DailyContextProcessorTest(SimpleTestCase):
+    '''Значения контекста считаются лениво и раз в сутки.'''
+
+    def setUp(self):
+        self.calls = []
+
+        @daily('value')
+        def processor(today):
+            self.calls.append(today)
+            return today.year
+
+        self.processor = processor
+
+    def test_value_is_lazy(self):
+        context = self.processor(None)
+        self.assertIsInstance(context['value'], SimpleLazyObject)
+        self.assertEqual(self.calls, [])
+
+    def test_value_memoized_until_midnight(self):
+        for _ in range(3):
+            str(self.processor(None)['value'])
+        self.assertEqual(len(self.calls), 1)
+        tomorrow = time.time() + 24 * 60 * 60
+        with mock.patch('core.context_processors.time.time',
+                        return_value=tomorrow):
+            str(self.processor(None)['value'])
+        self.assertEqual(len(self.calls), 2)
+
+    def test_bench_context_command(self):
+        out = StringIO()
+        call_command('bench_context', requests=10, stdout=out)
+        self.assertIn('core.context_processors.year.year', out.getvalue())
+
+
+class WarmUpTemplatesTest(SimpleTestCase):
+    '''Прогрев разбирает все шаблоны проекта в кеш загрузчика.'''
+
+    def test_templates_cached(self):
+        templates = [{
+            'BACKEND': 'core.metrics.TimedDjangoTemplates',
+            'DIRS': settings.TEMPLATES[0]['DIRS'],
+            'OPTIONS': {'loaders': [(
+                'django.template.loaders.cached.Loader',
+                ['django.template.loaders.filesystem.Loader'],
+            )]},
+        }]
+        with self.settings(TEMPLATES=templates):
+            names = warm_up_templates()
+            loader = Engine.get_default().template_loaders[0]
+            self.assertIn('includes/feed.html', names)
+            self.assertIn('core/404.html', names)
+            self.assertEqual(
+                set(loader.get_template_cache), set(names))
@@ -0,0 +1,27 @@
+import os
+
+from django.template import Engine
+
+
+def template_names(engine):
+    """Имена всех шаблонов из каталогов DIRS шаблонизатора."""
+    for directory in engine.dirs:
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                path = os.path.relpath(os.path.join(root, filename), directory)
+                yield path.replace(os.sep, '/')
+
+
+def warm_up_templates():
+    """Разбирает все шаблоны проекта заранее.
+
+    С кешированным загрузчиком (CACHED_TEMPLATES) разобранные шаблоны
+    остаются в памяти процесса, и первый запрос воркера не читает их
+    с диска. Ошибка в шаблоне всплывает при запуске, а не у посетителя.
+    Возвращает имена разобранных шаблонов.
+    """
+    engine = Engine.get_default()
+    names = sorted(set(template_names(engine)))
+    for name in names:
+        engine.get_template(name)
+    return names
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from posts.models import Comment, Follow, Group, Post
+from posts.models import (AuthorCounters, Comment, Follow, Group, Post,
+                          TimelineEntry)
+from posts.search import filter_matching
 
 
 @admin.register(Group)
@@ -30,6 +32,11 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return filter_matching(queryset, search_term), False
+
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
@@ -48,3 +55,26 @@ class FollowAdmin(admin.ModelAdmin):
         'author',
     )
     empty_value_display = '-пусто-'
+
+
+@admin.register(TimelineEntry)
+class TimelineEntryAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'user',
+        'post',
+        'pub_date',
+    )
+    empty_value_display = '-пусто-'
+
+
+@admin.register(AuthorCounters)
+class AuthorCountersAdmin(admin.ModelAdmin):
+    list_display = (
+        'user',
+        'post_count',
+        'comment_count',
+        'follower_count',
+        'following_count',
+    )
+    empty_value_display = '-пусто-'
@@ -0,0 +1,111 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+FEED_VERSION_KEY = 'posts:feed_version'
+
+LOCK_KEY = 'posts:lock:{}'
+
+# Сколько секунд держится блокировка перестройки значения
+REBUILD_LOCK_TIMEOUT = 30
+
+# Сколько секунд ждать чужой перестройки при пустом кеше
+REBUILD_WAIT = 2
+
+
+def feed_version():
+    """Текущая версия закешированных лент.
+
+    Версия входит в ключ фрагмента, поэтому её смена делает
+    недоступными все ранее сохранённые страницы разом.
+    """
+    return cache.get_or_set(FEED_VERSION_KEY, _fresh_version, None)
+
+
+def bump_feed_version():
+    """Сбрасывает кеш лент после изменения постов."""
+    try:
+        cache.incr(FEED_VERSION_KEY)
+    except ValueError:
+        cache.set(FEED_VERSION_KEY, _fresh_version(), None)
+
+
+def _fresh_version():
+    # Если ключ версии вытеснили из кеша, нельзя начинать снова с 1:
+    # старые фрагменты с той же версией могли ещё не истечь.
+    return int(time.time() * 1000)
+
+
+def request_language(request):
+    """Основной язык из Accept-Language, например 'ru-ru'."""
+    header = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
+    return header.split(',')[0].split(';')[0].strip().lower() or '-'
+
+
+def feed_page_key(request):
+    """Страница или курсор, которые запросил пользователь."""
+    if 'cursor' in request.GET:
+        return 'c' + request.GET.get('cursor', '')
+    return 'p' + request.GET.get('page', '1')
+
+
+def feed_cache_context(request):
+    """Переменные для vary-on ключей тега {% cache %} ленты."""
+    return {
+        'feed_version': feed_version(),
+        'feed_page': feed_page_key(request),
+        'feed_language': request_language(request),
+    }
+
+
+def cached(key, build, timeout, version=None):
+    """Значение из кеша с защитой от одновременной перестройки.
+
+    version входит в ключ записи, поэтому после её смены прежняя
+    копия не отдаётся никому. Запись живёт timeout секунд плюс
+    CACHE_STALE_TIMER. Когда она устарела по времени, перестраивает
+    её только процесс, взявший блокировку, а остальные тем временем
+    отдают старое значение (stale-while-revalidate). Если записи нет
+    (в том числе для новой версии), остальные недолго ждут результата
+    и лишь потом строят сами.
+
+    Блокировка — это cache.add(), поэтому L2 должен добавлять ключ
+    атомарно: Redis, memcached или core.cache.AtomicFileBasedCache
+    (у обычного FileBasedCache add() — это проверка и запись).
+    """
+    entry_key = key if version is None else f'{key}:{version}'
+    entry = cache.get(entry_key)
+    if entry is not None:
+        fresh_until, value = entry
+        if time.time() < fresh_until:
+            return value
+    lock_key = LOCK_KEY.format(key)
+    locked = cache.add(lock_key, True, REBUILD_LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            return entry[1]
+        entry = _wait_for(entry_key)
+        if entry is not None:
+            return entry[1]
+    try:
+        value = build()
+        cache.set(
+            entry_key,
+            (time.time() + timeout, value),
+            timeout + settings.CACHE_STALE_TIMER,
+        )
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
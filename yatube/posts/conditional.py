@@ -0,0 +1,94 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.views.decorators.http import condition
+from posts.models import Group, Post, User
+
+MODIFIED_KEY = 'posts:modified:{}:{}'
+
+
+def touch(kind, *pks):
+    """Отмечает объекты изменёнными прямо сейчас."""
+    now = time.time()
+    cache.set_many(
+        {MODIFIED_KEY.format(kind, pk): now for pk in pks if pk is not None},
+        None
+    )
+
+
+def last_modified(*objects):
+    """Время последнего изменения из пар (kind, pk).
+
+    Если отметку вытеснили из кеша, считаем объект изменённым сейчас:
+    лишний раз отрисовать страницу лучше, чем отдать устаревшую.
+    """
+    keys = [MODIFIED_KEY.format(kind, pk)
+            for kind, pk in objects if pk is not None]
+    stamps = cache.get_many(keys)
+    missing = [key for key in keys if key not in stamps]
+    if missing:
+        now = time.time()
+        cache.set_many({key: now for key in missing}, None)
+        stamps.update(dict.fromkeys(missing, now))
+    return max(stamps.values())
+
+
+# Общая отметка для данных, которые видны на чужих страницах: имена
+# авторов на страницах групп, названия групп на карточках профиля.
+# Группы и профили меняются редко, поэтому проще сбросить все страницы
+CONTENT = ('content', 0)
+
+
+def post_objects(post_id):
+    row = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id').first()
+    return row and [
+        ('post', post_id), ('user', row[0]), ('group', row[1]), CONTENT]
+
+
+def profile_objects(username):
+    row = User.objects.filter(username=username).values_list('pk').first()
+    return row and [('user', row[0]), CONTENT]
+
+
+def group_objects(slug):
+    row = Group.objects.filter(slug=slug).values_list('pk').first()
+    return row and [('group', row[0]), CONTENT]
+
+
+def conditional_page(objects_func):
+    """Отвечает 304 Not Modified, пока объекты страницы не менялись.
+
+    objects_func получает аргументы view и одним лёгким запросом
+    возвращает пары (kind, pk), от которых зависит страница, или None,
+    если объекта нет (тогда 404 отдаст сама view). ETag учитывает ещё
+    и пользователя: шапка и кнопки у каждого свои, а кнопки подписки
+    зависят и от его подписок.
+    """
+    def modified(request, *args, **kwargs):
+        if not hasattr(request, '_posts_modified'):
+            objects = objects_func(*args, **kwargs)
+            if objects and request.user.is_authenticated:
+                objects.append(('follows', request.user.pk))
+            request._posts_modified = objects and last_modified(*objects)
+        return request._posts_modified
+
+    def etag(request, *args, **kwargs):
+        stamp = modified(request, *args, **kwargs)
+        if stamp is None:
+            return None
+        return hashlib.md5(
+            f'{stamp!r}:{request.user.pk}'.encode()).hexdigest()
+
+    def last_modified_date(request, *args, **kwargs):
+        stamp = modified(request, *args, **kwargs)
+        # Last-Modified точен до секунды: пока секунда последней правки
+        # не кончилась, в неё может попасть ещё одна, и клиент без ETag
+        # получил бы неверный 304. До тех пор проверка только по ETag
+        if stamp is None or int(stamp) >= int(time.time()):
+            return None
+        return datetime.fromtimestamp(stamp, timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified_date)
@@ -0,0 +1,8 @@
+from posts.follows import follow_set
+
+
+def follows(request):
+    """Добавляет подписки пользователя для кнопок в лентах."""
+    return {
+        'follows': follow_set(request),
+    }
@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from posts.models import AuthorCounters, Comment, Follow, Post, User
+
+
+def change(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя выражениями F().
+
+    Строки без счётчиков не трогаем: их создаёт get_counters()
+    или команда rebuild_counters, пересчитав значения с нуля.
+    Ниже нуля счётчик не опускается, даже если успел разойтись
+    с таблицами. Сигналов нет у bulk_create() и QuerySet.update(),
+    в том числе при смене автора постов через update(): после них
+    нужна команда rebuild_counters.
+    """
+    if user_id is None:
+        return
+    AuthorCounters.objects.filter(user_id=user_id).update(
+        **{field: Greatest(F(field) + delta, 0)
+           for field, delta in deltas.items()}
+    )
+
+
+def _totals(model, field, users):
+    """{id пользователя: число строк model} одним запросом с GROUP BY."""
+    rows = model.objects.order_by()
+    if users is not None:
+        rows = rows.filter(**{f'{field}__in': users.values('pk')})
+    return dict(rows.values_list(field).annotate(total=Count('pk')))
+
+
+def _compute(users=None):
+    posts = _totals(Post, 'author', users)
+    comments = _totals(Comment, 'author', users)
+    followers = _totals(Follow, 'author', users)
+    following = _totals(Follow, 'user', users)
+    users = User.objects.all() if users is None else users
+    return [
+        AuthorCounters(
+            user_id=pk,
+            post_count=posts.get(pk, 0),
+            comment_count=comments.get(pk, 0),
+            follower_count=followers.get(pk, 0),
+            following_count=following.get(pk, 0),
+        )
+        for pk in users.values_list('pk', flat=True)
+    ]
+
+
+def rebuild(users=None):
+    """Пересчитывает счётчики пользователей по таблицам постов."""
+    counters = _compute(users)
+    with transaction.atomic():
+        if users is None:
+            AuthorCounters.objects.all().delete()
+        else:
+            AuthorCounters.objects.filter(
+                user__in=users.values('pk')).delete()
+        AuthorCounters.objects.bulk_create(counters)
+    return counters
+
+
+def get_counters(user):
+    """Счётчики пользователя, пересчитанные, если строки ещё нет.
+
+    Строку, которую успел создать параллельный запрос, не трогаем:
+    вставка без конфликтов и повторное чтение вместо delete и insert.
+    """
+    try:
+        return user.counters
+    except AuthorCounters.DoesNotExist:
+        AuthorCounters.objects.bulk_create(
+            _compute(User.objects.filter(pk=user.pk)),
+            ignore_conflicts=True,
+        )
+        user.counters = AuthorCounters.objects.get(user_id=user.pk)
+        return user.counters
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.cache import cache
+from posts.models import Follow
+
+FOLLOWING_KEY = 'posts:following:{}'
+
+
+def following_ids(user_id):
+    """id авторов, на которых подписан пользователь (кешируется)."""
+    return cache.get_or_set(
+        FOLLOWING_KEY.format(user_id),
+        lambda: frozenset(
+            Follow.objects.filter(user_id=user_id)
+            .values_list('author_id', flat=True)
+        ),
+        settings.CACHE_TIMER,
+    )
+
+
+def forget_following(user_id):
+    """Сбрасывает кеш подписок после подписки или отписки."""
+    cache.delete(FOLLOWING_KEY.format(user_id))
+
+
+class FollowSet:
+    """Подписки пользователя, загружаемые один раз на запрос.
+
+    Поддерживает оператор in, так что в шаблоне можно писать
+    {% if post.author_id in follows %} для любого числа авторов.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._ids = None
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            self._ids = (
+                following_ids(self.user.pk)
+                if self.user.is_authenticated else frozenset()
+            )
+        return self._ids
+
+    def is_following(self, author):
+        return getattr(author, 'pk', author) in self.ids
+
+    def __contains__(self, author):
+        return self.is_following(author)
+
+
+def follow_set(request):
+    """FollowSet текущего пользователя, общий для view и шаблонов."""
+    if not hasattr(request, '_follow_set'):
+        request._follow_set = FollowSet(request.user)
+    return request._follow_set
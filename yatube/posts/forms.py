@@ -1,5 +1,6 @@
 from django import forms
 from posts.models import Comment, Post
+from posts.thumbnails import schedule_thumbnails
 
 
 class PostForm(forms.ModelForm):
@@ -7,6 +8,24 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_errors = upload_errors or {}
+
+    def clean_image(self):
+        if 'image' in self.upload_errors:
+            raise forms.ValidationError(self.upload_errors['image'])
+        return self.cleaned_data['image']
+
+    def save(self, commit=True):
+        image_changed = 'image' in self.changed_data
+        if image_changed:
+            self.instance.thumbnails = ''
+        post = super().save(commit)
+        if commit and image_changed:
+            schedule_thumbnails(post)
+        return post
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,117 @@
+import timeit
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.test import RequestFactory, override_settings
+from django.urls import resolve, reverse
+from posts.follows import follow_set
+from posts.links import fast_reverse
+from posts.management.commands.bench_templates import templates_setting
+from posts.models import Follow, Post
+
+# Карточка в прежнем виде: по {% url %} на каждую ссылку
+LEGACY_FEED = (
+    '{% load post_images %}'
+    '{% with request.resolver_match.view_name as view_name %}'
+    '{% for post in page_obj %}'
+    '<article><ul><li>Автор: '
+    "{% if view_name == 'posts:profile' %}{{ post.author.get_full_name }}"
+    "{% else %}<a href=\"{% url 'posts:profile' post.author.username %}\">"
+    '{{ post.author.get_full_name }}</a>{% endif %}</li>'
+    '{% if user.is_authenticated and not shared_feed'
+    " and view_name != 'posts:profile' and post.author_id != user.pk %}<li>"
+    '{% if post.author_id in follows %}<a href="'
+    "{% url 'posts:profile_unfollow' post.author.username %}\">Отписаться</a>"
+    '{% else %}<a href="'
+    "{% url 'posts:profile_follow' post.author.username %}\">Подписаться</a>"
+    '{% endif %}</li>{% endif %}'
+    '<li>Дата публикации: {{ post.pub_date|date:"d E Y" }}</li></ul>'
+    '{% if post.image %}{% post_picture post'
+    ' "(max-width: 576px) 100vw, 30vw" "max-width: 30%;" %}{% endif %}'
+    '<p>{{ post.text }}</p>'
+    '<p class="text-muted">Комментариев: {{ post.comment_count }}'
+    '{% for comment in post.latest_comments %}'
+    '{% if forloop.first %}· последний от{% endif %}'
+    ' {{ comment.author.username }}{% if not forloop.last %},{% endif %}'
+    '{% endfor %}</p>'
+    "<a href=\"{% url 'posts:post_detail' post.pk %}\">Подробнее</a><br>"
+    "{% if post.group and view_name != 'posts:group_list' %}"
+    "<a href=\"{% url 'posts:group_list' post.group.slug %}\">"
+    'Показать все записи сообщества</a>'
+    '<span class="text-muted">{{ post.group.title }}</span>{% endif %}'
+    '</article>{% if not forloop.last %}<hr>{% endif %}'
+    '{% endfor %}'
+    '{% endwith %}'
+)
+
+
+def timed(func, count):
+    """Микросекунд на вызов func, лучший из пяти прогонов."""
+    return min(timeit.repeat(func, number=count, repeat=5)) / count * 1e6
+
+
+class Command(BaseCommand):
+    help = (
+        'Микробенчмарк ленты: адреса через reverse() и через posts.links, '
+        'отрисовка страницы ленты с {% url %} и с тегом feed_card'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=100,
+            help='Повторов в одном прогоне каждого замера',
+        )
+
+    def handle(self, *args, **options):
+        # Как в бою: шаблоны разобраны один раз, замеряется отрисовка
+        with override_settings(TEMPLATES=templates_setting(cached=True)):
+            self.bench(options['repeat'])
+
+    def bench(self, count):
+        posts = list(
+            Post.objects.for_feed()[:settings.LEN_PUBLIC_FEED])
+        if not posts:
+            raise CommandError('Нет постов: нечего отрисовывать')
+        follow = Follow.objects.select_related('user').first()
+        url = reverse('posts:index')
+        request = RequestFactory().get(url)
+        request.resolver_match = resolve(url)
+        request.user = follow.user if follow else AnonymousUser()
+        follow_set(request)
+
+        def reverse_links():
+            for post in posts:
+                reverse('posts:profile', args=(post.author.username,))
+                reverse('posts:post_detail', args=(post.pk,))
+                if post.group:
+                    reverse('posts:group_list', args=(post.group.slug,))
+
+        def fast_links():
+            for post in posts:
+                fast_reverse('posts:profile', post.author.username)
+                post.get_absolute_url()
+                if post.group:
+                    post.group.get_absolute_url()
+
+        engine = engines.all()[0]
+        legacy = engine.from_string(LEGACY_FEED)
+        feed = engine.get_template('includes/feed.html')
+        context = {'page_obj': posts}
+
+        rows = (
+            ('адреса', timed(reverse_links, count),
+             timed(fast_links, count)),
+            ('отрисовка',
+             timed(lambda: legacy.render(context, request), count),
+             timed(lambda: feed.render(context, request), count)),
+        )
+        self.stdout.write(
+            f'{len(posts)} постов на странице, мкс на страницу')
+        self.stdout.write(f'{"":<12}{"{% url %}":>12}{"feed_card":>12}')
+        for name, before, after in rows:
+            self.stdout.write(
+                f'{name:<12}{before:>12.1f}{after:>12.1f}'
+                f'   x{before / after:.1f}'
+            )
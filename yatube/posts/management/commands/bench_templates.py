@@ -0,0 +1,83 @@
+import copy
+import time
+
+from core.warmup import warm_up_templates
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.urls import reverse
+from posts.management.commands.bench_views import feed_urls, make_client
+from posts.models import Follow, Post
+
+CACHED_LOADER = 'django.template.loaders.cached.Loader'
+
+# Режимы: кешировать ли шаблоны и разбирать ли их до первого запроса
+MODES = (
+    ('с диска', False, False),
+    ('кеш', True, False),
+    ('кеш+прогрев', True, True),
+)
+
+
+def templates_setting(cached):
+    """Копия TEMPLATES с кешированным загрузчиком или без него."""
+    templates = copy.deepcopy(settings.TEMPLATES)
+    templates[0].pop('APP_DIRS', None)
+    loaders = settings.YATUBE_TEMPLATE_LOADERS
+    templates[0]['OPTIONS']['loaders'] = (
+        [(CACHED_LOADER, loaders)] if cached else loaders)
+    return templates
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время ответа view с шаблонами с диска, с кешированным '
+        'загрузчиком и с кешированным загрузчиком после прогрева'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Запросов к каждой view в каждом режиме',
+        )
+
+    def handle(self, *args, **options):
+        post = Post.objects.select_related('author', 'group').first()
+        if post is None:
+            raise CommandError('Нет постов: нечего отрисовывать')
+        follow = Follow.objects.select_related('user').first()
+        urls = feed_urls(post, follow.user if follow else None) + [
+            ('about_author', reverse('about:author'), None),
+            ('about_tech', reverse('about:tech'), None),
+        ]
+        count = options['requests']
+
+        self.stdout.write(f'{"":<14}' + ''.join(
+            f'{mode:>24}' for mode, _, _ in MODES))
+        self.stdout.write(f'{"":<14}' + ''.join(
+            f'{"первый / средний, мс":>24}' for _ in MODES))
+        results = {name: [] for name, _, _ in urls}
+        for _, cached, warm in MODES:
+            with override_settings(TEMPLATES=templates_setting(cached),
+                                   PAGE_CACHE_ENABLED=False):
+                cache.clear()
+                if warm:
+                    warm_up_templates()
+                for name, url, user in urls:
+                    results[name].append(self.measure(url, user, count))
+        for name, timings in results.items():
+            self.stdout.write(f'{name:<14}' + ''.join(
+                f'{first:>13.2f} / {average:>6.2f}'
+                for first, average in timings))
+
+    def measure(self, url, user, count):
+        client = make_client(user)
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: {response.status_code}')
+        return timings[0], sum(timings[1:]) / max(count - 1, 1)
@@ -0,0 +1,91 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import Client
+from django.urls import reverse
+from posts.models import Follow, Post
+
+
+def feed_urls(post, follower):
+    """Адреса читающих view, которые нагружает бенчмарк."""
+    urls = [
+        ('index', reverse('posts:index'), None),
+        ('profile', reverse('posts:profile', args=(post.author.username,)),
+         None),
+        ('post_detail', reverse('posts:post_detail', args=(post.pk,)), None),
+    ]
+    if post.group is not None:
+        urls.append(('group_posts', reverse(
+            'posts:group_list', args=(post.group.slug,)), None))
+    if follower is not None:
+        urls.append(('follow_index', reverse('posts:follow_index'), follower))
+    return urls
+
+
+def make_client(user):
+    # Не 127.0.0.1, иначе в ответы встраивается debug toolbar
+    client = Client(REMOTE_ADDR='10.0.0.1')
+    if user is not None:
+        client.force_login(user)
+    return client
+
+
+def run_requests(url, user, count):
+    client = make_client(user)
+    try:
+        for _ in range(count):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: {response.status_code}')
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет пропускную способность читающих view через WSGI-обработчик '
+        'Django: запросов в секунду всего и на одно ядро'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Запросов к каждой view в одном потоке',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=os.cpu_count() or 1,
+            help='Число потоков, как у воркеров WSGI-сервера',
+        )
+
+    def handle(self, *args, **options):
+        post = Post.objects.select_related('author', 'group').first()
+        if post is None:
+            raise CommandError('Нет постов: нечего нагружать')
+        follow = Follow.objects.select_related('user').first()
+        follower = follow.user if follow else None
+        concurrency = options['concurrency']
+        count = options['requests']
+        cores = len(os.sched_getaffinity(0)) if hasattr(
+            os, 'sched_getaffinity') else os.cpu_count() or 1
+
+        for name, url, user in feed_urls(post, follower):
+            started = time.perf_counter()
+            if concurrency == 1:
+                run_requests(url, user, count)
+            else:
+                with ThreadPoolExecutor(concurrency) as executor:
+                    futures = [
+                        executor.submit(run_requests, url, user, count)
+                        for _ in range(concurrency)
+                    ]
+                    for future in futures:
+                        future.result()
+            elapsed = time.perf_counter() - started
+            rps = count * concurrency / elapsed
+            self.stdout.write(
+                f'{name:<14} {rps:9.1f} запр/с  '
+                f'{rps / min(concurrency, cores):8.1f} запр/с на ядро'
+            )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры для постов с изображениями, у которых их нет'
+
+    def handle(self, *args, **options):
+        post_ids = Post.objects.exclude(image='').filter(
+            thumbnails='').values_list('pk', flat=True)
+        for post_id in post_ids.iterator():
+            generate_thumbnails(post_id)
+        self.stdout.write(self.style.SUCCESS('Миниатюры построены'))
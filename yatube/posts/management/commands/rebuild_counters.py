@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from posts.counters import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок с нуля'
+
+    def handle(self, *args, **options):
+        counters = rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересчитано пользователей: {len(counters)}')
+        )
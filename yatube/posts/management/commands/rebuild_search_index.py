@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from posts.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс по текстам постов'
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(
+            self.style.SUCCESS(f'Проиндексировано постов: {count}')
+        )
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorCounters = apps.get_model('posts', 'AuthorCounters')
+
+    def totals(model, field):
+        # Один запрос с GROUP BY на таблицу вместо COUNT на пользователя
+        return dict(model.objects.order_by().values_list(field).annotate(
+            total=models.Count('pk')))
+
+    posts = totals(Post, 'author')
+    comments = totals(Comment, 'author')
+    followers = totals(Follow, 'author')
+    following = totals(Follow, 'user')
+    AuthorCounters.objects.bulk_create(
+        (AuthorCounters(
+            user_id=user_id,
+            post_count=posts.get(user_id, 0),
+            comment_count=comments.get(user_id, 0),
+            follower_count=followers.get(user_id, 0),
+            following_count=following.get(user_id, 0),
+        ) for user_id in User.objects.values_list('pk', flat=True)),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0003_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorCounters',
+            fields=[
+                ('user', models.OneToOneField(help_text='Пользователь, к которому относятся счётчики', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('post_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('comment_count', models.PositiveIntegerField(default=0, verbose_name='Комментариев')),
+                ('follower_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики автора',
+                'verbose_name_plural': 'Счётчики авторов',
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
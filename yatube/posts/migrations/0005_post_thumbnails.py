@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_authorcounters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnails',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Адреса заранее построенных миниатюр изображения (JSON)', verbose_name='Миниатюры'),
+        ),
+    ]
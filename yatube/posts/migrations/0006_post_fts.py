@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# Копия posts.search.FTS_TABLE: миграция не зависит от живого модуля
+FTS_TABLE = 'posts_post_fts'
+
+
+def create_fts(apps, schema_editor):
+    """Создаёт пустой индекс; заполняет его команда rebuild_search_index.
+
+    Стеммер меняется вместе с posts.search, поэтому посты, написанные
+    до миграции, индексирует команда, а не сама миграция.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(stems)')
+    except OperationalError:
+        # SQLite собран без FTS5: поиск работает через LIKE
+        return
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_post_thumbnails'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
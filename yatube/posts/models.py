@@ -1,6 +1,12 @@
+import json
+from operator import attrgetter
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
+from posts.links import fast_reverse
 
 User = get_user_model()
 
@@ -21,11 +27,89 @@ class Group(models.Model):
     def __str__(self):
         return str(self.title)
 
+    def get_absolute_url(self):
+        return fast_reverse('posts:group_list', self.slug)
+
     class Meta:
         verbose_name = 'Группа'
         verbose_name_plural = 'Группы'
 
 
+class PostQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._latest_comments = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._latest_comments = self._latest_comments
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is None
+        super()._fetch_all()
+        if fetched and self._latest_comments:
+            attach_latest_comments(self._result_cache, self.db)
+
+    def for_feed(self):
+        """Посты для карточек ленты.
+
+        К посту подтягиваются автор и группа, число комментариев
+        (comment_count) и FEED_LATEST_COMMENTS последних комментариев
+        (latest_comments). На любую страницу это один запрос постов
+        и один запрос комментариев, оба по индексам без сортировки.
+        """
+        comment_count = Subquery(
+            Comment.objects.filter(post=OuterRef('pk'))
+            .order_by()
+            .values('post')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        queryset = self.select_related('author', 'group').annotate(
+            comment_count=Coalesce(comment_count, 0)
+        )
+        queryset._latest_comments = True
+        return queryset
+
+
+def attach_latest_comments(posts, using):
+    """Кладёт в post.latest_comments последние комментарии постов.
+
+    Django 2.2 не умеет фильтровать по оконной функции, поэтому
+    комментарии постов страницы нумеруются ROW_NUMBER() во вложенном
+    запросе, а номер проверяется во внешнем. В отличие от
+    коррелированного подзапроса, комментарии читаются один раз.
+    """
+    for post in posts:
+        post.latest_comments = []
+    if not posts or not settings.FEED_LATEST_COMMENTS:
+        return
+    ranked = Comment.objects.filter(
+        post__in=[post.pk for post in posts]
+    ).annotate(
+        comment_rank=Window(
+            RowNumber(),
+            partition_by=F('post'),
+            order_by=F('created').desc(),
+        )
+    ).order_by().values('pk', 'comment_rank')
+    sql, params = ranked.query.get_compiler(using).as_sql()
+    comments = Comment.objects.using(using).extra(
+        where=[
+            f'posts_comment.id IN (SELECT id FROM ({sql}) '
+            f'WHERE comment_rank <= %s)'
+        ],
+        params=[*params, settings.FEED_LATEST_COMMENTS],
+    ).select_related('author').order_by()
+    by_pk = {post.pk: post for post in posts}
+    for comment in sorted(comments, key=attrgetter('created'),
+                          reverse=True):
+        post = by_pk[comment.post_id]
+        comment.post = post
+        post.latest_comments.append(comment)
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -56,15 +140,54 @@ class Post(models.Model):
         verbose_name='Изображение',
         help_text='Выберите изображение для публикации'
     )
+    thumbnails = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Миниатюры',
+        help_text='Адреса заранее построенных миниатюр изображения (JSON)'
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date'],
+                name='post_group_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-pub_date', 'id'],
+                name='post_pub_date_id_idx'
+            ),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
     def __str__(self):
         return str(self.text)[:settings.LEN_DEF__STR__POST_MODEL] + '...'
 
+    def get_absolute_url(self):
+        return fast_reverse('posts:post_detail', self.pk)
+
+    @property
+    def thumbnail_url(self):
+        """Готовая миниатюра, а пока её нет — исходное изображение."""
+        if not self.image:
+            return ''
+        urls = json.loads(self.thumbnails or '{}')
+        return urls.get(settings.POST_THUMBNAIL_GEOMETRY) or self.image.url
+
+    @property
+    def image_sources(self):
+        """Пары (mime, srcset) перекодированных вариантов изображения."""
+        return json.loads(self.thumbnails or '{}').get('sources', [])
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -96,6 +219,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['post', '-created'],
+                name='comment_post_created_idx'
+            ),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -130,8 +259,86 @@ class Follow(models.Model):
                 name='unique_fields'
             )
         ]
+        # (user, author) покрывает уникальный индекс ограничения выше,
+        # (author, user) нужен для выборки подписчиков автора
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            ),
+        ]
         verbose_name = 'Подписчик'
         verbose_name_plural = 'Подписчики'
 
     def __str__(self):
         return f'{self.user.username} подписан на {self.author.username}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+        help_text='Пользователь, в ленту подписок которого попал пост'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+        help_text='Пост автора, на которого подписан пользователь'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+        help_text='Копия даты публикации поста для сортировки ленты')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', 'post'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'
+            )
+        ]
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+
+    def __str__(self):
+        return f'{self.post_id} в ленте {self.user_id}'
+
+
+class AuthorCounters(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='Пользователь',
+        help_text='Пользователь, к которому относятся счётчики'
+    )
+    post_count = models.PositiveIntegerField(
+        verbose_name='Постов',
+        default=0)
+    comment_count = models.PositiveIntegerField(
+        verbose_name='Комментариев',
+        default=0)
+    follower_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0)
+    following_count = models.PositiveIntegerField(
+        verbose_name='Подписок',
+        default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики автора'
+        verbose_name_plural = 'Счётчики авторов'
+
+    def __str__(self):
+        return f'Счётчики {self.user_id}'
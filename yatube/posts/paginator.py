@@ -1,8 +1,288 @@
+import base64
+import binascii
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.paginator import Page, Paginator
+from django.db import connections
+from django.db.models import Max, Min, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+CURSOR_AFTER = 'a'
+CURSOR_BEFORE = 'b'
+
+# Поля ключа курсора: дата публикации и id поста
+FEED_KEY = ('pub_date', 'pk')
+
+# Ключ курсора комментариев: дата создания и id
+COMMENT_KEY = ('created', 'pk')
+
+# Больше id в базе не бывает: SQLite и PostgreSQL хранят 64 бита
+MAX_CURSOR_ID = 2 ** 63 - 1
+
+
+def encode_cursor(obj, direction=CURSOR_AFTER, key=FEED_KEY):
+    """Упаковывает (дата, id) объекта в непрозрачный токен."""
+    date_field, id_field = key
+    raw = (f'{direction}|{getattr(obj, date_field).isoformat()}'
+           f'|{getattr(obj, id_field)}')
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(token):
+    """Возвращает (direction, pub_date, id) или None для битого токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token.encode()).decode()
+        direction, pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if (direction not in (CURSOR_AFTER, CURSOR_BEFORE)
+            or pub_date is None
+            or not 1 <= pk <= MAX_CURSOR_ID):
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPage(Page):
+    """Страница ленты, выбранная по ключу (pub_date, id) без OFFSET."""
+    cursor_mode = True
+
+    def __init__(self, object_list, paginator,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def start_index(self):
+        return None
+
+    def end_index(self):
+        return None
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (pub_date, id).
+
+    Стоимость страницы не зависит от её глубины: вместо COUNT(*)
+    и OFFSET выполняется один запрос с условием по ключу. Порядок
+    (-pub_date, id) совпадает с индексами лент. В key можно передать
+    другие имена полей ключа, например аннотации из связанной таблицы.
+    """
 
+    def __init__(self, object_list, per_page, key=FEED_KEY, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.key = key
+        self.date_field, self.id_field = key
 
-def paginator(post_list, request):
-    paginator = Paginator(post_list, settings.LEN_PUBLIC_FEED)
+    def page_from_cursor(self, token):
+        decoded = decode_cursor(token or '')
+        if decoded is None:
+            return self._forward_page(self.object_list, has_previous=False)
+        direction, pub_date, pk = decoded
+        if direction == CURSOR_BEFORE:
+            return self._backward_page(pub_date, pk)
+        return self._forward_page(
+            self.object_list.filter(
+                Q(**{f'{self.date_field}__lt': pub_date})
+                | Q(**{self.date_field: pub_date,
+                       f'{self.id_field}__gt': pk})
+            ),
+            has_previous=True,
+        )
+
+    def _forward_page(self, queryset, has_previous):
+        rows = list(
+            queryset.order_by(
+                f'-{self.date_field}', self.id_field
+            )[:self.per_page + 1]
+        )
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return CursorPage(
+            rows,
+            self,
+            next_cursor=(
+                encode_cursor(rows[-1], key=self.key)
+                if has_next else None),
+            previous_cursor=(
+                encode_cursor(rows[0], CURSOR_BEFORE, self.key)
+                if has_previous and rows else None),
+        )
+
+    def _backward_page(self, pub_date, pk):
+        rows = list(
+            self.object_list.filter(
+                Q(**{f'{self.date_field}__gt': pub_date})
+                | Q(**{self.date_field: pub_date,
+                       f'{self.id_field}__lt': pk})
+            ).order_by(
+                self.date_field, f'-{self.id_field}'
+            )[:self.per_page + 1]
+        )
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(
+            rows,
+            self,
+            next_cursor=(
+                encode_cursor(rows[-1], key=self.key) if rows else None),
+            previous_cursor=(
+                encode_cursor(rows[0], CURSOR_BEFORE, self.key)
+                if has_previous else None),
+        )
+
+
+def estimated_count(queryset):
+    """Оценка числа строк таблицы queryset без COUNT(*) или None.
+
+    Оценить можно только queryset без фильтров. В PostgreSQL берётся
+    статистика планировщика, в остальных базах — разброс первичных
+    ключей: два поиска по индексу. Удалённые строки оценку только
+    завышают.
+    """
+    if queryset.query.where:
+        return None
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] >= 0 else None
+    bounds = model._base_manager.using(queryset.db).aggregate(
+        first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return 0
+    return bounds['last'] - bounds['first'] + 1
+
+
+class FeedPaginator(Paginator):
+    """Paginator, который считает посты без аннотаций ленты.
+
+    Иначе COUNT(*) выполнялся бы по подзапросу со всеми аннотациями
+    (например, comment_count) для каждого поста таблицы. С approximate
+    большие таблицы (от APPROXIMATE_COUNT_THRESHOLD строк) не
+    считаются вовсе, а оцениваются через estimated_count. Когда
+    страница оказывается последней, оценка заменяется точным числом.
+    """
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, approximate=False, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.approximate = approximate
+        self.estimated = False
+
+    @cached_property
+    def count(self):
+        if self.approximate:
+            estimate = estimated_count(self.object_list)
+            if (estimate is not None
+                    and estimate >= settings.APPROXIMATE_COUNT_THRESHOLD):
+                self.estimated = True
+                return estimate
+        return self.object_list.values('pk').count()
+
+    def get_page(self, number):
+        page = super().get_page(number)
+        if self.estimated and len(page.object_list) < self.per_page:
+            # Конец ленты найден: дальше число постов известно точно
+            if page.object_list:
+                self._settle_count(
+                    (page.number - 1) * self.per_page + len(page.object_list))
+            else:
+                self._settle_count(self.object_list.values('pk').count())
+                page = super().get_page(number)
+        return page
+
+    def _settle_count(self, count):
+        self.estimated = False
+        self.count = count
+        self.__dict__.pop('num_pages', None)
+
+    def get_elided_page_range(self, number=1, *, on_each_side=3, on_ends=2):
+        """Номера страниц вокруг текущей и по краям, пропуски — ELLIPSIS.
+
+        Как Paginator.get_elided_page_range из новых версий Django:
+        число ссылок не зависит от числа страниц.
+        """
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(
+                self.num_pages - on_ends + 1, self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+
+def paginator(post_list, request, key=FEED_KEY, count=None,
+              approximate=False):
+    """Страница ленты.
+
+    С параметром ?cursor= работает курсорный режим, иначе обычная
+    нумерованная пагинация ?page=. У нумерованной страницы есть
+    next_cursor, чтобы ссылка «Следующая» уводила в курсорный режим,
+    и elided_page_range — ограниченное окно номеров страниц.
+    Известное заранее число постов (count) избавляет от COUNT(*),
+    approximate заменяет его оценкой на больших таблицах.
+    С key=None курсоров нет, а порядок post_list сохраняется
+    (например, выдача поиска по релевантности).
+    """
+    if key is not None and 'cursor' in request.GET:
+        return CursorPaginator(
+            post_list, settings.LEN_PUBLIC_FEED, key=key
+        ).page_from_cursor(request.GET.get('cursor'))
+    if key is not None:
+        date_field, id_field = key
+        post_list = post_list.order_by(f'-{date_field}', id_field)
+    paginator = FeedPaginator(
+        post_list, settings.LEN_PUBLIC_FEED, approximate=approximate)
+    if count is not None:
+        paginator.count = count
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    page_obj = paginator.get_page(page_number)
+    page_obj.object_list = list(page_obj.object_list)
+    page_obj.elided_page_range = list(paginator.get_elided_page_range(
+        page_obj.number,
+        on_each_side=settings.PAGE_WINDOW_ON_EACH_SIDE,
+        on_ends=settings.PAGE_WINDOW_ON_ENDS,
+    ))
+    page_obj.next_cursor = (
+        encode_cursor(page_obj.object_list[-1], key=key)
+        if key is not None and page_obj.has_next() else None
+    )
+    return page_obj
+
+
+def comments_page(comments, cursor=None):
+    """Страница комментариев, новые первыми, без COUNT(*) и OFFSET.
+
+    Первая страница стоит одинаково при любом числе комментариев,
+    следующие подгружаются по next_cursor.
+    """
+    return CursorPaginator(
+        comments, settings.LEN_COMMENTS_PAGE, key=COMMENT_KEY
+    ).page_from_cursor(cursor)
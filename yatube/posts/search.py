@@ -0,0 +1,226 @@
+import re
+
+from django.db import connections, router
+from posts.models import Post
+
+FTS_TABLE = 'posts_post_fts'
+
+WORD_RE = re.compile(r'\w+')
+
+VOWELS = 'аеиоуыэюя'
+
+# Окончания русского стеммера Snowball, сгруппированные по шагам.
+# Окончания из *_AFTER_A допустимы только после «а» или «я».
+PERFECTIVE_GERUND_AFTER_A = ('вшись', 'вши', 'в')
+PERFECTIVE_GERUND = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+REFLEXIVE = ('ся', 'сь')
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое',
+    'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую',
+    'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE_AFTER_A = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE = ('ивш', 'ывш', 'ующ')
+VERB_AFTER_A = (
+    'ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но',
+    'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н',
+)
+VERB = (
+    'ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило',
+    'ыло', 'ено', 'ует', 'уют', 'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй',
+    'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю',
+)
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие',
+    'ье', 'еи', 'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом', 'ах',
+    'ях', 'ию', 'ью', 'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у', 'ы',
+    'ь', 'ю', 'я',
+)
+DERIVATIONAL = ('ость', 'ост')
+SUPERLATIVE = ('ейше', 'ейш')
+
+
+def _region_start(word, start=0):
+    """Начало области после первой пары «гласная, согласная»."""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _strip(rv, endings, after_a=False):
+    """Отрезает самое длинное подходящее окончание или возвращает None."""
+    for ending in sorted(endings, key=len, reverse=True):
+        if not rv.endswith(ending):
+            continue
+        stem = rv[:-len(ending)]
+        if after_a and not stem.endswith(('а', 'я')):
+            continue
+        return stem
+    return None
+
+
+def _strip_any(rv, endings, endings_after_a):
+    stem_a = _strip(rv, endings_after_a, after_a=True)
+    stem = _strip(rv, endings)
+    if stem_a is None:
+        return stem
+    if stem is None:
+        return stem_a
+    return min(stem, stem_a, key=len)
+
+
+def stem(word):
+    """Основа русского слова по алгоритму Snowball."""
+    word = word.lower().replace('ё', 'е')
+    rv_start = next(
+        (i + 1 for i, char in enumerate(word) if char in VOWELS),
+        len(word)
+    )
+    r2_start = _region_start(word, _region_start(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1
+    stripped = _strip_any(rv, PERFECTIVE_GERUND, PERFECTIVE_GERUND_AFTER_A)
+    if stripped is None:
+        reflexive = _strip(rv, REFLEXIVE)
+        rv = rv if reflexive is None else reflexive
+        adjective = _strip(rv, ADJECTIVE)
+        if adjective is not None:
+            stripped = _strip_any(
+                adjective, PARTICIPLE, PARTICIPLE_AFTER_A
+            ) or adjective
+        else:
+            stripped = _strip_any(rv, VERB, VERB_AFTER_A)
+            if stripped is None:
+                stripped = _strip(rv, NOUN)
+    rv = rv if stripped is None else stripped
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательные окончания только в R2
+    derivational = _strip(rv, DERIVATIONAL)
+    if derivational is not None and (
+            rv_start + len(derivational) >= r2_start):
+        rv = derivational
+
+    # Шаг 4
+    superlative = _strip(rv, SUPERLATIVE)
+    if superlative is not None:
+        rv = superlative
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    elif superlative is None and rv.endswith('ь'):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+def stem_text(text):
+    """Текст поста в виде основ слов для поискового индекса."""
+    return ' '.join(stem(word) for word in WORD_RE.findall(text.lower()))
+
+
+def match_expression(query):
+    """Выражение FTS5 MATCH: все основы запроса как префиксы."""
+    stems = [stem(word) for word in WORD_RE.findall(query.lower())]
+    return ' '.join(f'"{word}"*' for word in stems if word)
+
+
+_fts_tables = {}
+
+
+def fts_enabled(using):
+    """Есть ли в базе using таблица FTS5 (создаётся миграцией на SQLite).
+
+    Ответ запоминается для каждого соединения отдельно: на реплике
+    и на основной базе он может различаться.
+    """
+    if using not in _fts_tables:
+        connection = connections[using]
+        _fts_tables[using] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_tables[using]
+
+
+def _write_db():
+    return router.db_for_write(Post)
+
+
+def index_post(post):
+    using = _write_db()
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, stems) VALUES (%s, %s)',
+            [post.pk, stem_text(post.text)]
+        )
+
+
+def unindex_post(post_id):
+    using = _write_db()
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild_index():
+    """Заново заполняет поисковый индекс всеми постами."""
+    using = _write_db()
+    if not fts_enabled(using):
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        rows = Post.objects.using(using).values_list(
+            'pk', 'text').iterator()
+        count = 0
+        for pk, text in rows:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, stems) VALUES (%s, %s)',
+                [pk, stem_text(text)]
+            )
+            count += 1
+    return count
+
+
+def filter_matching(queryset, query):
+    """Оставляет в queryset только посты, подходящие под запрос."""
+    match = match_expression(query)
+    if not match:
+        return queryset.none()
+    if not fts_enabled(queryset.db):
+        return queryset.filter(text__icontains=query)
+    return queryset.extra(
+        where=[
+            f'posts_post.id IN (SELECT rowid FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s)'
+        ],
+        params=[match],
+    )
+
+
+def search_posts(query):
+    """Посты по запросу, самые релевантные (bm25) первыми."""
+    posts = Post.objects.select_related('author', 'group')
+    match = match_expression(query)
+    if not match:
+        return posts.none()
+    if not fts_enabled(posts.db):
+        return posts.filter(text__icontains=query)
+    return posts.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = posts_post.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[match],
+        select={'search_rank': f'{FTS_TABLE}.rank'},
+    ).order_by('search_rank', '-pub_date')
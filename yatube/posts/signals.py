@@ -0,0 +1,214 @@
+from core.page_cache import bump_page_version
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from posts import counters, search, timeline
+from posts.conditional import CONTENT, touch
+from posts.cache import bump_feed_version
+from posts.follows import forget_following
+from posts.models import (AuthorCounters, Comment, Follow, Group, Post,
+                          User)
+from posts.thumbnails import delete_variants
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_feed_cache(sender, **kwargs):
+    """Посты, число комментариев и комментаторы сразу видны в ленте."""
+    bump_feed_version()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_pages(sender, **kwargs):
+    """Закешированные целиком страницы сразу показывают изменения."""
+    bump_page_version()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_pages(sender, instance, created, update_fields=None,
+                          **kwargs):
+    """Сбрасывает профиль и посты автора, а не все страницы.
+
+    Нового пользователя ещё нет ни на одной странице, а вход
+    обновляет только last_login, которого на страницах нет.
+    """
+    if not created and update_fields != frozenset({'last_login'}):
+        bump_page_version(f'user:{instance.pk}')
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    """Новый пост попадает в ленты подписок."""
+    if created and not raw:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    """Новый и изменённый текст поста сразу находится поиском."""
+    if not raw:
+        search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def remove_variants(sender, instance, **kwargs):
+    """Варианты картинки удалённого поста больше никому не нужны."""
+    post_id = instance.pk
+    transaction.on_commit(lambda: delete_variants(post_id))
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    """После подписки в ленте сразу видны посты автора."""
+    if created and not raw:
+        timeline.backfill(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    """После отписки посты автора уходят из ленты."""
+    timeline.trim(instance)
+
+
+@receiver(post_save, sender=User)
+def create_counters(sender, instance, created, raw=False, **kwargs):
+    """У нового пользователя сразу есть нулевые счётчики."""
+    if created and not raw:
+        AuthorCounters.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change(instance.author_id, post_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change(instance.author_id, post_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change(instance.author_id, comment_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change(instance.author_id, comment_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change(instance.author_id, follower_count=1)
+        counters.change(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change(instance.author_id, follower_count=-1)
+    counters.change(instance.user_id, following_count=-1)
+
+
+@receiver(post_delete, sender=Follow)
+def fan_out_former_celebrity(sender, instance, **kwargs):
+    """Посты автора, переставшего быть знаменитостью, не пропадают."""
+    followers = AuthorCounters.objects.filter(
+        user_id=instance.author_id).values_list(
+            'follower_count', flat=True).first()
+    if followers == settings.TIMELINE_FANOUT_LIMIT:
+        timeline.backfill_former_celebrity(instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def move_post(sender, instance, raw=False, **kwargs):
+    """Пост, перенесённый в другую группу или к другому автору.
+
+    Пропадает со страницы старой группы, а счётчики постов
+    переходят от старого автора к новому.
+    """
+    if raw or instance.pk is None:
+        return
+    previous = Post.objects.filter(pk=instance.pk).values_list(
+        'author_id', 'group_id').first()
+    if previous is None:
+        return
+    author_id, group_id = previous
+    if group_id != instance.group_id:
+        touch('group', group_id)
+    if author_id != instance.author_id:
+        touch('user', author_id)
+        counters.change(author_id, post_count=-1)
+        counters.change(instance.author_id, post_count=1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def touch_post(sender, instance, **kwargs):
+    """Страницы поста, автора и группы больше не отдаются как 304."""
+    touch('post', instance.pk)
+    touch('user', instance.author_id)
+    touch('group', instance.group_id)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def touch_commented_post(sender, instance, **kwargs):
+    """Комментарии видны на карточках поста в профиле и группе."""
+    touch('post', instance.post_id)
+    row = Post.objects.filter(pk=instance.post_id).values_list(
+        'author_id', 'group_id').first()
+    if row is not None:
+        touch('user', row[0])
+        touch('group', row[1])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def touch_followed_author(sender, instance, **kwargs):
+    touch('user', instance.author_id)
+    touch('follows', instance.user_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_following(sender, instance, **kwargs):
+    """Кнопки подписки сразу показывают новое состояние."""
+    forget_following(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def touch_user(sender, instance, created, update_fields=None, **kwargs):
+    touch('user', instance.pk)
+    # Имя автора есть и на страницах групп и постов, а у нового
+    # пользователя ещё нет ни постов, ни комментариев
+    if not created and update_fields != frozenset({'last_login'}):
+        touch(*CONTENT)
+
+
+@receiver(post_delete, sender=User)
+def touch_deleted_user(sender, instance, **kwargs):
+    touch(*CONTENT)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def touch_group(sender, instance, **kwargs):
+    """Название группы видно на карточках профилей и постов."""
+    touch('group', instance.pk)
+    touch(*CONTENT)
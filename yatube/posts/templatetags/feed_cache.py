@@ -0,0 +1,54 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+from posts.cache import cached
+
+register = template.Library()
+
+
+class StaleCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, vary_on, version):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.version = version
+
+    def render(self, context):
+        key = make_template_fragment_key(
+            self.fragment_name,
+            [var.resolve(context) for var in self.vary_on]
+        )
+        return cached(
+            key,
+            lambda: self.nodelist.render(context),
+            int(self.timeout.resolve(context)),
+            version=self.version and self.version.resolve(context),
+        )
+
+
+@register.tag
+def stalecache(parser, token):
+    """Как {% cache %}, но через posts.cache.cached.
+
+    {% stalecache timeout fragment_name [vary_on ...] [version=var] %}
+
+    version входит в ключ: после её смены прежняя копия не отдаётся,
+    а фрагмент строит один процесс, пока остальные ждут. Устаревшую
+    по времени запись остальные отдают, пока её перестраивают.
+    """
+    nodelist = parser.parse(('endstalecache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]} требует минимум два аргумента')
+    version = None
+    if tokens[-1].startswith('version='):
+        version = parser.compile_filter(tokens.pop()[len('version='):])
+    return StaleCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]],
+        version,
+    )
@@ -0,0 +1,42 @@
+from django import template
+from posts.links import fast_reverse
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/feed_card.html', takes_context=True)
+def feed_card(context, post, view_name=None, shared_feed=False):
+    """Карточка поста в ленте.
+
+    Все ссылки и условия карточки собираются здесь за один проход:
+    адреса через get_absolute_url и posts.links, без {% url %}
+    и без повторных обращений к контексту из шаблона.
+    """
+    user = context['user']
+    author = post.author
+    author_url = author.get_absolute_url()
+    on_profile = view_name == 'posts:profile'
+    show_follow = (
+        user.is_authenticated
+        and not shared_feed
+        and not on_profile
+        and post.author_id != user.pk
+    )
+    following = show_follow and post.author_id in context['follows']
+    group = post.group
+    return {
+        'post': post,
+        'author_url': None if on_profile else author_url,
+        'show_follow': show_follow,
+        'following': following,
+        'follow_url': show_follow and fast_reverse(
+            'posts:profile_unfollow' if following
+            else 'posts:profile_follow',
+            author.username,
+        ),
+        'post_url': post.get_absolute_url(),
+        'group_url': (
+            group.get_absolute_url()
+            if group and view_name != 'posts:group_list' else None
+        ),
+    }
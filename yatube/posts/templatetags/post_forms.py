@@ -0,0 +1,10 @@
+from django import template
+from posts.forms import CommentForm
+
+register = template.Library()
+
+
+@register.simple_tag
+def empty_comment_form():
+    """Пустая форма комментария для фрагмента, который рисуется без view."""
+    return CommentForm()
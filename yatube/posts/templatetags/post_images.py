@@ -0,0 +1,14 @@
+from django import template
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/picture.html')
+def post_picture(post, sizes='100vw', style='max-width: 100%;'):
+    """<picture> с вариантами WebP/AVIF и миниатюрой по умолчанию."""
+    return {
+        'post': post,
+        'sources': post.image_sources,
+        'sizes': sizes,
+        'style': style,
+    }
@@ -1,15 +1,30 @@
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO
+from unittest import mock
 
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
+from PIL import Image
 from posts.models import Comment, Group, Post, User
+from posts.thumbnails import (build_variants, delete_variants,
+                              generate_thumbnails, variants_folder)
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00'
+    b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+    b'\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostFormTest(TestCase):
@@ -30,13 +45,7 @@ class PostFormTest(TestCase):
             slug='test_group_slug',
             description='Описание тестовой группы.'
         )
-        cls.small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x01\x00'
-            b'\x01\x00\x00\x00\x00\x21\xf9\x04'
-            b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
-            b'\x00\x00\x01\x00\x01\x00\x00\x02'
-            b'\x02\x4c\x01\x00\x3b'
-        )
+        cls.small_gif = SMALL_GIF
         cls.uploaded = SimpleUploadedFile(
             name='small.gif',
             content=cls.small_gif,
@@ -127,6 +136,199 @@ class PostFormTest(TestCase):
         self.assertEqual(post.text, 'Текст первого поста для тестов.')
         self.assertEqual(Post.objects.count(), posts_counter)
 
+    def test_thumbnails_pregenerated(self):
+        '''Миниатюры строятся заранее и попадают в шаблон готовыми.'''
+        post = Post.objects.create(
+            text='Пост с картинкой',
+            author=PostFormTest.author,
+            image=SimpleUploadedFile(
+                name='thumb.gif',
+                content=PostFormTest.small_gif,
+                content_type='image/gif'
+            ),
+        )
+        self.assertEqual(post.thumbnail_url, post.image.url)
+
+        generate_thumbnails(post.id)
+        post.refresh_from_db()
+        self.assertNotEqual(post.thumbnail_url, post.image.url)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.id]))
+        self.assertContains(response, post.thumbnail_url)
+
+        # Варианты WebP нескольких ширин попадают в <picture>
+        sources = dict(post.image_sources)
+        self.assertIn('image/webp', sources)
+        for width in settings.POST_IMAGE_WIDTHS:
+            self.assertIn(f'.webp {width}w', sources['image/webp'])
+        self.assertContains(response, '<source type="image/webp"')
+
+    def test_replaced_image_gets_new_variant_urls(self):
+        '''После замены картинки у вариантов новые адреса, старые удалены.'''
+        post = Post.objects.create(
+            text='Пост с картинкой',
+            author=PostFormTest.author,
+            image=SimpleUploadedFile(
+                name='first.gif',
+                content=PostFormTest.small_gif,
+                content_type='image/gif'
+            ),
+        )
+        generate_thumbnails(post.id)
+        post.refresh_from_db()
+        old_sources = dict(post.image_sources)['image/webp']
+
+        post.image = SimpleUploadedFile(
+            name='second.gif',
+            content=PostFormTest.small_gif.replace(b'\x4c', b'\x44'),
+            content_type='image/gif'
+        )
+        post.save()
+        generate_thumbnails(post.id)
+        post.refresh_from_db()
+        new_sources = dict(post.image_sources)['image/webp']
+        self.assertNotEqual(new_sources, old_sources)
+        self.assertEqual(len(self.variant_files(post.id)), 1)
+
+        delete_variants(post.id)
+        self.assertEqual(self.variant_files(post.id), [])
+
+    def image_post(self, name='first.gif'):
+        return Post.objects.create(
+            text='Пост с картинкой',
+            author=PostFormTest.author,
+            image=SimpleUploadedFile(
+                name=name,
+                content=PostFormTest.small_gif,
+                content_type='image/gif'
+            ),
+        )
+
+    def test_stale_job_keeps_newer_variants(self):
+        '''Задача для старой картинки не затирает новую.'''
+        post = self.image_post()
+        generate_thumbnails(post.id)
+        post.refresh_from_db()
+        thumbnails = post.thumbnails
+
+        def replace_image(post):
+            # Пока задача строила варианты, картинку успели заменить
+            result = build_variants(post)
+            Post.objects.filter(pk=post.pk).update(image='posts/new.gif')
+            return result
+
+        with mock.patch('posts.thumbnails.build_variants', replace_image):
+            Post.objects.filter(pk=post.pk).update(thumbnails='')
+            generate_thumbnails(post.id)
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnails, '')
+        self.assertNotEqual(thumbnails, '')
+
+    def test_cleared_image_removes_variants(self):
+        '''Без картинки у поста не остаётся вариантов.'''
+        post = self.image_post()
+        generate_thumbnails(post.id)
+        self.assertEqual(len(self.variant_files(post.id)), 1)
+        post.image = None
+        post.save()
+        generate_thumbnails(post.id)
+        self.assertEqual(self.variant_files(post.id), [])
+
+    def variant_files(self, post_id):
+        '''Непустые папки вариантов поста.'''
+        root = variants_folder(post_id)
+        return [
+            folder for folder in default_storage.listdir(root)[0]
+            if default_storage.listdir(f'{root}/{folder}')[1]
+        ]
+
+    def test_transparent_image_flattened_on_background(self):
+        '''Прозрачное в миниатюрах заливается фоном, а не чернеет.'''
+        buffer = BytesIO()
+        Image.new('RGBA', (40, 40), (0, 0, 0, 0)).save(buffer, 'PNG')
+        post = Post.objects.create(
+            text='Пост с прозрачной картинкой',
+            author=PostFormTest.author,
+            image=SimpleUploadedFile(
+                name='transparent.png',
+                content=buffer.getvalue(),
+                content_type='image/png'
+            ),
+        )
+        generate_thumbnails(post.id)
+        post.refresh_from_db()
+        srcset = dict(post.image_sources)['image/webp']
+        for url in (post.thumbnail_url, srcset.split()[0]):
+            with self.subTest(url=url):
+                name = url[len(settings.MEDIA_URL):]
+                with default_storage.open(name) as file, \
+                        Image.open(file) as thumbnail:
+                    self.assertEqual(
+                        thumbnail.convert('RGB').getpixel((0, 0)),
+                        (255, 255, 255),
+                    )
+
+    def post_image(self, name):
+        '''Отправляет форму нового поста с картинкой small_gif.'''
+        return self.author_client.post(
+            reverse('posts:post_create'),
+            {'text': 'Пост с большой картинкой',
+             'image': SimpleUploadedFile(
+                 name=name,
+                 content=PostFormTest.small_gif,
+                 content_type='image/gif'
+             )}
+        )
+
+    @override_settings(POST_IMAGE_MAX_SIZE=10)
+    def test_too_large_file_rejected_while_streaming(self):
+        '''Файл больше POST_IMAGE_MAX_SIZE отбрасывается при загрузке.'''
+        posts_counter = Post.objects.count()
+        response = self.post_image('big.gif')
+        self.assertEqual(Post.objects.count(), posts_counter)
+        self.assertIn('image', response.context['form'].errors)
+
+    @override_settings(POST_IMAGE_MAX_DIMENSION=0)
+    def test_too_wide_image_rejected_by_header(self):
+        '''Размеры картинки проверяются по заголовку файла.'''
+        posts_counter = Post.objects.count()
+        response = self.post_image('wide.gif')
+        self.assertEqual(Post.objects.count(), posts_counter)
+        self.assertIn(
+            'Изображение 1x1 слишком большое',
+            response.context['form'].errors['image'][0]
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class PostFormThumbnailsTest(TransactionTestCase):
+    '''Сохранение формы с картинкой ставит построение миниатюр.
+
+    TransactionTestCase: в TestCase транзакция не коммитится, и
+    колбэки on_commit, в которых запускается построение, не вызываются.
+    '''
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_form_save_schedules_thumbnails(self):
+        '''После сохранения формы у поста готовы миниатюры.'''
+        author = User.objects.create_user(username='test_user_author')
+        client = Client()
+        client.force_login(author)
+        client.post(
+            reverse('posts:post_create'),
+            {'text': 'Пост с картинкой',
+             'image': SimpleUploadedFile(
+                 name='scheduled.gif',
+                 content=SMALL_GIF,
+                 content_type='image/gif'
+             )}
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertTrue(post.thumbnails)
+        self.assertNotEqual(post.thumbnail_url, post.image.url)
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class CommentFormTest(TestCase):
@@ -1,7 +1,13 @@
+from io import StringIO
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import Client, TestCase
-from posts.models import Comment, Follow, Group, Post, User
+from django.urls import reverse
+from posts import counters
+from posts.links import fast_reverse
+from posts.models import AuthorCounters, Comment, Follow, Group, Post, User
 
 User = get_user_model()
 
@@ -238,3 +244,95 @@ class FollowModelTest(TestCase):
             f"Ожидалось '{expected_follow_str}', "
             f"получено '{str(FollowModelTest.follow)}'"
         )
+
+
+class AuthorCountersTest(TestCase):
+    '''Счётчики автора обновляются сигналами и пересчитываются.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='test_user')
+        cls.reader = User.objects.create_user(username='test_reader')
+
+    def counters(self, user):
+        return AuthorCounters.objects.get(user=user)
+
+    def test_counters_follow_changes(self):
+        '''Создание и удаление объектов сдвигает счётчики.'''
+        post = Post.objects.create(text='Пост', author=self.author)
+        Comment.objects.create(post=post, text='Ответ', author=self.reader)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        author = self.counters(self.author)
+        reader = self.counters(self.reader)
+        self.assertEqual(author.post_count, 1)
+        self.assertEqual(author.follower_count, 1)
+        self.assertEqual(reader.comment_count, 1)
+        self.assertEqual(reader.following_count, 1)
+
+        follow.delete()
+        post.delete()
+        author = self.counters(self.author)
+        reader = self.counters(self.reader)
+        self.assertEqual(author.post_count, 0)
+        self.assertEqual(author.follower_count, 0)
+        self.assertEqual(reader.comment_count, 0)
+        self.assertEqual(reader.following_count, 0)
+
+    def test_counters_follow_post_author_change(self):
+        '''Пост, переданный другому автору, переносит счётчик.'''
+        post = Post.objects.create(text='Пост', author=self.author)
+        post.author = self.reader
+        post.save()
+        self.assertEqual(self.counters(self.author).post_count, 0)
+        self.assertEqual(self.counters(self.reader).post_count, 1)
+
+    def test_rebuild_counters_command(self):
+        '''Команда rebuild_counters пересчитывает счётчики с нуля.'''
+        Post.objects.bulk_create(
+            Post(text=f'Пост #{i}', author=self.author) for i in range(3)
+        )
+        AuthorCounters.objects.all().delete()
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(self.counters(self.author).post_count, 3)
+        self.assertEqual(self.counters(self.reader).post_count, 0)
+
+    def test_get_counters_survives_parallel_creation(self):
+        '''Строку, созданную параллельным запросом, get_counters читает.'''
+        Post.objects.create(text='Пост', author=self.author)
+        AuthorCounters.objects.all().delete()
+        author = User.objects.get(pk=self.author.pk)
+        with self.assertRaises(AuthorCounters.DoesNotExist):
+            author.counters
+        # Пока этот запрос считал, строку успел создать другой
+        counters.rebuild(User.objects.filter(pk=self.author.pk))
+        self.assertEqual(counters.get_counters(author).post_count, 1)
+
+
+class AbsoluteUrlTest(TestCase):
+    '''Адреса моделей без резолвера совпадают с reverse().'''
+
+    def test_fast_reverse_matches_reverse(self):
+        for viewname, value in (
+            ('posts:profile', 'Пётр.Иванов+test@mail'),
+            ('posts:profile_follow', 'user_1-2'),
+            ('posts:post_detail', 42),
+            ('posts:group_list', 'test-group_1'),
+        ):
+            with self.subTest(viewname=viewname, value=value):
+                self.assertEqual(
+                    fast_reverse(viewname, value),
+                    reverse(viewname, args=(value,)),
+                )
+
+    def test_get_absolute_url(self):
+        author = User.objects.create_user(username='Автор.1')
+        group = Group.objects.create(title='Группа', slug='test_slug')
+        post = Post.objects.create(text='Пост', author=author, group=group)
+        self.assertEqual(
+            author.get_absolute_url(),
+            reverse('posts:profile', args=(author.username,)))
+        self.assertEqual(
+            group.get_absolute_url(),
+            reverse('posts:group_list', args=(group.slug,)))
+        self.assertEqual(
+            post.get_absolute_url(),
+            reverse('posts:post_detail', args=(post.pk,)))
@@ -0,0 +1,192 @@
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from importlib import import_module
+
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from faker import Faker
+from posts import counters, search, timeline
+from posts.models import Comment, Follow, Group, Post, User
+
+# Размер тестовых данных; PERF_SCALE=10 даёт десятки тысяч строк
+SCALE = float(os.getenv('PERF_SCALE', 1))
+QTY_USERS = int(1000 * SCALE)
+QTY_GROUPS = int(20 * SCALE) or 1
+QTY_POSTS = int(3000 * SCALE)
+QTY_COMMENTS = int(6000 * SCALE)
+QTY_FOLLOWS = int(3000 * SCALE)
+
+# Сколько раз запрашивать каждый адрес для p50/p95
+REPEATS = int(os.getenv('PERF_REPEATS', 5))
+
+# Куда записать отчёт с числом запросов и временем ответа
+REPORT_PATH = os.getenv(
+    'PERF_REPORT', os.path.join(tempfile.gettempdir(), 'yatube_perf.json'))
+
+# Необязательный предел p95 в миллисекундах для всех адресов
+P95_BUDGET_MS = float(os.getenv('PERF_P95_MS', 0)) or None
+
+# Предел числа SQL-запросов на один ответ. Запрос на каждую карточку
+# ленты сразу выбьет страницу за бюджет; статичным страницам и формам
+# хватает DEFAULT_QUERY_BUDGET (сессия и пользователь). Главная
+# сначала оценивает размер таблицы постов, а маленькую ещё и считает
+DEFAULT_QUERY_BUDGET = 2
+QUERY_BUDGETS = {
+    'posts:index': 6,
+    'posts:group_list': 8,
+    'posts:profile': 7,
+    'posts:post_detail': 5,
+    'posts:post_create': 3,
+    'posts:edit': 5,
+    'posts:post_comments': 5,
+    'posts:add_comment': 3,
+    'posts:follow_index': 7,
+    'posts:profile_follow': 4,
+    # Отписка ещё проверяет, не перестал ли автор быть знаменитостью
+    'posts:profile_unfollow': 9,
+    'users:logout': 0,
+    'users:password_reset_confirm': 1,
+}
+
+URL_MODULES = ('posts', 'users', 'about')
+
+# Адреса, которые открывают без входа: выход и ссылка из письма
+ANONYMOUS_ROUTES = ('users:logout', 'users:password_reset_confirm')
+
+
+def routes():
+    """Имена и параметры всех маршрутов posts, users и about."""
+    for namespace in URL_MODULES:
+        module = import_module(f'{namespace}.urls')
+        for pattern in module.urlpatterns:
+            yield (
+                f'{namespace}:{pattern.name}',
+                list(pattern.pattern.converters),
+            )
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class PerformanceBudgetTest(TestCase):
+    '''Бюджет SQL-запросов и время ответа каждого адреса на больших данных.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        fake = Faker('ru_RU')
+        fake.seed_instance(0)
+        rnd = random.Random(0)
+        User.objects.bulk_create(
+            User(username=f'perf_user_{i}', first_name=fake.first_name())
+            for i in range(QTY_USERS)
+        )
+        user_ids = list(User.objects.values_list('pk', flat=True))
+        Group.objects.bulk_create(
+            Group(title=fake.sentence(nb_words=2), slug=f'perf_group_{i}',
+                  description=fake.sentence())
+            for i in range(QTY_GROUPS)
+        )
+        group_ids = list(Group.objects.values_list('pk', flat=True))
+        Post.objects.bulk_create(
+            Post(author_id=rnd.choice(user_ids),
+                 group_id=rnd.choice(group_ids + [None]),
+                 text=fake.paragraph(nb_sentences=3))
+            for _ in range(QTY_POSTS)
+        )
+        post_ids = list(Post.objects.values_list('pk', flat=True))
+        Comment.objects.bulk_create(
+            Comment(post_id=rnd.choice(post_ids),
+                    author_id=rnd.choice(user_ids),
+                    text=fake.sentence())
+            for _ in range(QTY_COMMENTS)
+        )
+        pairs = {
+            tuple(rnd.sample(user_ids, 2)) for _ in range(QTY_FOLLOWS)
+        }
+        Follow.objects.bulk_create(
+            Follow(user_id=user, author_id=author) for user, author in pairs
+        )
+        counters.rebuild()
+        search.rebuild_index()
+
+        # Читатель — автор свежего поста в группе, подписанный на авторов
+        cls.post = Post.objects.select_related('author', 'group').filter(
+            group__isnull=False).order_by('-pk').first()
+        cls.viewer = cls.post.author
+        cls.author = User.objects.exclude(pk=cls.viewer.pk).filter(
+            posts__isnull=False).first()
+        for author_id in rnd.sample(user_ids, 30):
+            if author_id != cls.viewer.pk:
+                Follow.objects.get_or_create(
+                    user=cls.viewer, author_id=author_id)
+        for follow in Follow.objects.filter(user=cls.viewer):
+            timeline.backfill(follow)
+        Follow.objects.get_or_create(user=cls.viewer, author=cls.author)
+        cls.kwargs = {
+            'username': cls.author.username,
+            'slug': cls.post.group.slug,
+            'post_id': cls.post.pk,
+            'uidb64': urlsafe_base64_encode(force_bytes(cls.viewer.pk)),
+            'token': default_token_generator.make_token(cls.viewer),
+        }
+        cls.report = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        with open(REPORT_PATH, 'w', encoding='utf-8') as report:
+            json.dump(cls.report, report, ensure_ascii=False, indent=2)
+        super().tearDownClass()
+
+    def prepare(self, name):
+        '''Состояние, нужное адресу перед каждым запросом.'''
+        if name == 'posts:profile_unfollow':
+            Follow.objects.get_or_create(user=self.viewer, author=self.author)
+
+    def measure(self, name, url):
+        timings = []
+        queries = []
+        cache.clear()
+        for _ in range(REPEATS):
+            # Не 127.0.0.1, иначе в ответы встраивается debug toolbar
+            client = Client(REMOTE_ADDR='10.0.0.1')
+            if name not in ANONYMOUS_ROUTES:
+                client.force_login(self.viewer)
+            self.prepare(name)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.assertLess(response.status_code, 400, url)
+            queries.append(len(captured))
+        return {
+            'url': url,
+            'queries': max(queries),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+        }
+
+    def test_routes_within_budget(self):
+        for name, params in routes():
+            url = reverse(name, kwargs={
+                param: self.kwargs[param] for param in params})
+            result = self.measure(name, url)
+            self.report[name] = result
+            with self.subTest(route=name):
+                self.assertLessEqual(
+                    result['queries'],
+                    QUERY_BUDGETS.get(name, DEFAULT_QUERY_BUDGET),
+                )
+                if P95_BUDGET_MS is not None:
+                    self.assertLessEqual(result['p95_ms'], P95_BUDGET_MS)
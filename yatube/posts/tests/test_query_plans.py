@@ -0,0 +1,130 @@
+import re
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginator import CURSOR_BEFORE, encode_cursor
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?posts_\w+( AS \w+)?$')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+# Список групп в форме поста выбирает таблицу целиком и не может
+# обойтись без её полного обхода. Остальные запросы без WHERE
+# (например, первая страница ленты) проверяются как все
+WHOLE_TABLE_QUERIES = {str(Group.objects.all().query)}
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class QueryPlanTest(TestCase):
+    '''Запросы лент используют индексы, а не полный обход и сортировку.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='test_user')
+        cls.follower = User.objects.create_user(username='test_follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_group_slug',
+            description='Описание тестовой группы.'
+        )
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        for i in range(3):
+            cls.post = Post.objects.create(
+                text=f'Текст поста #{i}',
+                author=cls.author,
+                group=cls.group,
+            )
+            Comment.objects.create(
+                post=cls.post,
+                text=f'Комментарий #{i}',
+                author=cls.follower,
+            )
+        cursor_after = '?cursor=' + encode_cursor(cls.post)
+        cursor_before = '?cursor=' + encode_cursor(cls.post, CURSOR_BEFORE)
+        cls.test_data_feeds = [
+            ('posts:index', []),
+            ('posts:group_list', [cls.group.slug]),
+            ('posts:profile', [cls.author.username]),
+            ('posts:follow_index', []),
+        ]
+        cls.test_data_urls = [
+            reverse(name, args=args) + query
+            for name, args in cls.test_data_feeds
+            for query in ('?page=1', cursor_after, cursor_before)
+        ]
+        cls.test_data_pages = [
+            ('posts:index', []),
+            ('posts:group_list', [cls.group.slug]),
+            ('posts:profile', [cls.author.username]),
+            ('posts:post_detail', [cls.post.id]),
+            ('posts:post_create', []),
+            ('posts:edit', [cls.post.id]),
+            ('posts:add_comment', [cls.post.id]),
+            ('posts:follow_index', []),
+            ('posts:profile_follow', [cls.author.username]),
+            ('posts:profile_unfollow', [cls.author.username]),
+        ]
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+
+    def query_plans(self, client, url):
+        '''Планы всех SELECT к таблицам posts_*, выполненных страницей.'''
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or 'posts_' not in sql:
+                    continue
+                if sql in WHOLE_TABLE_QUERIES:
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def test_views_use_indexes(self):
+        '''Ни один запрос view из posts не обходит таблицу целиком.'''
+        for reverse_name, args in QueryPlanTest.test_data_pages:
+            client = (
+                self.author_client if reverse_name == 'posts:edit'
+                else self.follower_client
+            )
+            url = reverse(reverse_name, args=args)
+            for sql, plan in self.query_plans(client, url):
+                with self.subTest(view=reverse_name, sql=sql):
+                    for step in plan:
+                        self.assertNotRegex(step, FULL_SCAN)
+                        self.assertNotIn(TEMP_SORT, step)
+
+    def test_feed_pages_use_indexes(self):
+        '''Нумерованные и курсорные страницы лент читаются по индексам.'''
+        for url in QueryPlanTest.test_data_urls:
+            for sql, plan in self.query_plans(self.follower_client, url):
+                with self.subTest(url=url, sql=sql):
+                    for step in plan:
+                        self.assertNotRegex(step, FULL_SCAN)
+                        self.assertNotIn(TEMP_SORT, step)
+
+    def test_latest_comments_ranked_in_one_pass(self):
+        '''Последние комментарии ленты нумеруются окном за один проход.'''
+        cache.clear()
+        plans = [
+            plan for sql, plan in self.query_plans(
+                self.follower_client, reverse('posts:index'))
+            if 'ROW_NUMBER()' in sql
+        ]
+        self.assertEqual(len(plans), 1)
+        self.assertIn(
+            'SEARCH posts_comment USING COVERING INDEX '
+            'comment_post_created_idx (post_id=?)',
+            plans[0])
+        for step in plans[0]:
+            self.assertNotIn('CORRELATED', step)
@@ -1,21 +1,45 @@
+import base64
 import shutil
 import tempfile
+import time
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
+from core import metrics
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.core.paginator import Page
+from django.db import connection
 from django.shortcuts import get_object_or_404
-from django.test import Client, TestCase, override_settings
+from django.test import (Client, SimpleTestCase, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from posts.cache import (LOCK_KEY, bump_feed_version, cached,
+                         feed_version)
 from posts.forms import CommentForm
-from posts.models import Comment, Follow, Group, Post, User
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry,
+                          User)
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+def later(seconds=2):
+    '''Часы, убежавшие вперёд: правки остались в прошлых секундах.'''
+    now = time.time
+    return mock.patch('time.time', lambda: now() + seconds)
+
+
+def huge_id_cursor():
+    '''Курсор, id которого не помещается в INTEGER базы.'''
+    raw = f'a|2020-01-01T00:00:00+00:00|{"9" * 30}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class ViewsTests(TestCase):
     '''Проверка основных адресов и соответствия шаблонов.'''
@@ -268,6 +292,19 @@ class ViewsTests(TestCase):
         comments = context['comments'][0]
         self.assertEqual(comments, ViewsTests.comment)
 
+    def test_profile_and_detail_without_count_queries(self):
+        '''Число постов автора берётся из счётчиков, без COUNT(*).'''
+        urls = (
+            reverse('posts:profile', args=[ViewsTests.author.username]),
+            reverse('posts:post_detail', args=[ViewsTests.post.id]),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                for query in queries.captured_queries:
+                    self.assertNotIn('COUNT(*)', query['sql'])
+
     def test_post_create_page_show_correct_context(self):
         '''Шаблон post_create сформирован с правильным контекстом.'''
         response = self.author_client.get(reverse('posts:post_create'))
@@ -335,6 +372,328 @@ class PaginatorViewsTest(TestCase):
             len(page_obj), self.qty_posts - settings.LEN_PUBLIC_FEED
         )
 
+    def test_cursor_pages_walk_whole_feed(self):
+        '''Курсорные страницы проходят ленту без пропусков и повторов.'''
+        first_page = self.client.get(
+            reverse('posts:index')).context['page_obj']
+        response = self.client.get(
+            reverse('posts:index') + f'?cursor={first_page.next_cursor}')
+        page_obj = response.context['page_obj']
+        self.assertTrue(page_obj.cursor_mode)
+        self.assertFalse(page_obj.has_next())
+        self.assertEqual(
+            len(page_obj), self.qty_posts - settings.LEN_PUBLIC_FEED
+        )
+        self.assertFalse(
+            set(first_page.object_list) & set(page_obj.object_list))
+
+        response = self.client.get(
+            reverse('posts:index') + f'?cursor={page_obj.previous_cursor}')
+        previous_page = response.context['page_obj']
+        self.assertEqual(
+            list(previous_page.object_list), list(first_page.object_list))
+        self.assertFalse(previous_page.has_previous())
+
+    def test_broken_cursor_returns_first_page(self):
+        '''Битый курсор отдаёт первую страницу.'''
+        response = self.client.get(reverse('posts:index') + '?cursor=xx')
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), settings.LEN_PUBLIC_FEED)
+        self.assertFalse(page_obj.has_previous())
+
+    def test_cursor_with_huge_id_returns_first_page(self):
+        '''Курсор с id больше 64 бит отдаёт первую страницу, а не 500.'''
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': huge_id_cursor()})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), settings.LEN_PUBLIC_FEED)
+        self.assertFalse(page_obj.has_previous())
+
+    @override_settings(LEN_PUBLIC_FEED=1, PAGE_WINDOW_ON_EACH_SIDE=2,
+                       PAGE_WINDOW_ON_ENDS=1)
+    def test_page_links_are_elided(self):
+        '''Пагинатор показывает окно страниц, а не все номера.'''
+        cache.clear()
+        response = self.client.get(reverse('posts:index') + '?page=8')
+        page_obj = response.context['page_obj']
+        ellipsis = page_obj.paginator.ELLIPSIS
+        self.assertEqual(
+            page_obj.elided_page_range,
+            [1, ellipsis, 6, 7, 8, 9, 10, ellipsis, self.qty_posts],
+        )
+        self.assertContains(response, ellipsis, count=2)
+        self.assertNotContains(response, '?page=3"')
+
+    @override_settings(APPROXIMATE_COUNT_THRESHOLD=1)
+    def test_big_feed_is_not_counted(self):
+        '''Большую ленту главная оценивает, а считает только в конце.'''
+        cache.clear()
+        Post.objects.filter(
+            pk=Post.objects.order_by('pk')[5].pk).delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        self.assertFalse(
+            any('COUNT(*)' in query['sql'] for query in queries))
+        self.assertTrue(response.context['page_obj'].paginator.estimated)
+
+        cache.clear()
+        response = self.client.get(reverse('posts:index') + '?page=2')
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.paginator.count, self.qty_posts - 1)
+        self.assertEqual(page_obj.paginator.num_pages, 2)
+        self.assertFalse(page_obj.has_next())
+
+        response = self.client.get(reverse('posts:index') + '?page=5')
+        self.assertEqual(response.context['page_obj'].number, 2)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SearchViewsTest(TestCase):
+    '''Тестирование полнотекстового поиска.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='test_user')
+        cls.post_books = Post.objects.create(
+            author=cls.author,
+            text='Обменяюсь книгами о котах',
+        )
+        cls.post_cats = Post.objects.create(
+            author=cls.author,
+            text='Котов много не бывает, котов любят все',
+        )
+        Post.objects.create(author=cls.author, text='Про собаку')
+
+    def search(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        return list(response.context['page_obj'])
+
+    def test_search_finds_word_forms(self):
+        '''Поиск находит посты по другим формам слова.'''
+        self.assertEqual(self.search('книга'), [self.post_books])
+        self.assertEqual(self.search('Коты'), [self.post_cats,
+                                               self.post_books])
+
+    def test_search_all_words_required(self):
+        '''В выдаче только посты со всеми словами запроса.'''
+        self.assertEqual(self.search('книжный кот'), [])
+        self.assertEqual(self.search('книги кот'), [self.post_books])
+
+    def test_search_index_follows_edits_and_deletes(self):
+        '''Правка и удаление поста сразу видны в поиске.'''
+        self.post_books.text = 'Обменяюсь журналами'
+        self.post_books.save()
+        self.assertEqual(self.search('книги'), [])
+        self.assertEqual(self.search('журнал'), [self.post_books])
+        self.post_books.delete()
+        self.assertEqual(self.search('журнал'), [])
+
+    def test_empty_query(self):
+        '''Пустой запрос ничего не ищет.'''
+        self.assertEqual(self.search('  '), [])
+        self.assertEqual(self.search('"*'), [])
+
+
+class CommentsPaginationTest(TestCase):
+    '''Комментарии поста выводятся страницами по курсору.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='test_user')
+        cls.post = Post.objects.create(
+            text='Популярный пост.',
+            author=cls.author,
+        )
+        cls.qty_comments = settings.LEN_COMMENTS_PAGE * 2 + 5
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.author, text=f'Коммент {i}')
+            for i in range(cls.qty_comments)
+        )
+
+    def test_comments_load_page_by_page(self):
+        '''Подгрузка проходит все комментарии без пропусков и повторов.'''
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), settings.LEN_COMMENTS_PAGE)
+        seen = list(comments)
+        while comments.has_next():
+            response = self.client.get(
+                reverse('posts:post_comments', args=(self.post.pk,)),
+                {'cursor': comments.next_cursor},
+            )
+            self.assertTemplateUsed(response, 'includes/comment_list.html')
+            comments = response.context['comments']
+            seen.extend(comments)
+        self.assertEqual(len(seen), self.qty_comments)
+        self.assertEqual(
+            seen, list(self.post.comments.order_by('-created', 'pk')))
+
+    def test_comments_with_huge_id_cursor(self):
+        '''Курсор с id больше 64 бит отдаёт первые комментарии.'''
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk,)),
+            {'cursor': huge_id_cursor()},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), settings.LEN_COMMENTS_PAGE)
+        self.assertFalse(comments.has_previous())
+
+    def test_post_page_cost_independent_of_comments(self):
+        '''Число запросов страницы поста не растёт с комментариями.'''
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        with CaptureQueriesContext(connection) as many_comments:
+            self.client.get(url)
+        Comment.objects.filter(post=self.post).delete()
+        with CaptureQueriesContext(connection) as no_comments:
+            self.client.get(url)
+        self.assertEqual(len(many_comments), len(no_comments))
+        self.assertFalse(any(
+            'COUNT(' in query['sql']
+            for query in many_comments.captured_queries
+        ))
+
+
+class ConditionalGetTest(TestCase):
+    '''Повторные запросы без изменений получают 304 Not Modified.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='test_author')
+        cls.reader = User.objects.create_user(username='test_reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_group_slug',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other_group_slug',
+        )
+        cls.post = Post.objects.create(
+            text='Текст поста для тестов.',
+            author=cls.author,
+            group=cls.group,
+        )
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def revalidate(self, url, client=None):
+        '''Статус повторного запроса с ETag первого ответа.'''
+        client = client or self.client
+        etag = client.get(url)['ETag']
+        return client.get(url, HTTP_IF_NONE_MATCH=etag).status_code
+
+    def test_not_modified_without_rendering(self):
+        '''304 отдаётся одним лёгким запросом, без шаблона.'''
+        for url in (
+            reverse('posts:post_detail', args=(self.post.pk,)),
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:group_list', args=(self.group.slug,)),
+        ):
+            with self.subTest(url=url), later():
+                response = self.client.get(url)
+                self.assertIn('Last-Modified', response)
+                with self.assertNumQueries(1):
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED)
+                self.assertIsNone(response.context)
+                response = self.client.get(
+                    url,
+                    HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+                )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_changes_invalidate_validators(self):
+        '''После изменений страница отдаётся заново.'''
+        detail = reverse('posts:post_detail', args=(self.post.pk,))
+        profile = reverse('posts:profile', args=(self.author.username,))
+        old_group = reverse('posts:group_list', args=(self.group.slug,))
+        new_group = reverse(
+            'posts:group_list', args=(self.other_group.slug,))
+
+        def comment():
+            Comment.objects.create(
+                post=self.post, author=self.reader, text='Коммент')
+
+        changes = (
+            (detail, comment),
+            (profile, comment),
+            (old_group, comment),
+            (profile, lambda: Follow.objects.create(
+                user=self.reader, author=self.author)),
+            (old_group, self.post.save),
+        )
+        for url, change in changes:
+            with self.subTest(url=url):
+                etag = self.reader_client.get(url)['ETag']
+                change()
+                response = self.reader_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+        etags = [self.client.get(url)['ETag']
+                 for url in (old_group, new_group)]
+        self.post.group = self.other_group
+        self.post.save()
+        for url, etag in zip((old_group, new_group), etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_shared_data_invalidates_other_pages(self):
+        '''Группа и автор видны и на чужих страницах.'''
+        detail = reverse('posts:post_detail', args=(self.post.pk,))
+        profile = reverse('posts:profile', args=(self.author.username,))
+        group = reverse('posts:group_list', args=(self.group.slug,))
+
+        def rename_group():
+            self.group.title = 'Новое название'
+            self.group.save()
+
+        def rename_author():
+            self.author.first_name = 'Автор'
+            self.author.save()
+
+        changes = (
+            (detail, rename_group),
+            (profile, rename_group),
+            (group, rename_author),
+        )
+        for url, change in changes:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                change()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_last_modified_only_after_second_ends(self):
+        '''Last-Modified не отдаётся, пока идёт секунда последней правки.'''
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        self.post.save()
+        self.assertFalse(self.client.get(url).has_header('Last-Modified'))
+        with later():
+            response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_etag_depends_on_user(self):
+        '''Страница гостя не подходит авторизованному пользователю.'''
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        self.assertNotEqual(
+            self.client.get(url)['ETag'],
+            self.reader_client.get(url)['ETag'],
+        )
+        self.assertEqual(
+            self.revalidate(url, self.reader_client), HTTPStatus.NOT_MODIFIED)
+
+    def test_missing_object_is_404(self):
+        response = self.client.get(
+            reverse('posts:profile', args=('nobody',)))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class CacheTest(TestCase):
@@ -379,15 +738,16 @@ class CacheTest(TestCase):
         self.author_client.force_login(self.author)
 
     def test_cache(self):
-        '''Пост виден через settings.CACHE_TIMER сек после публикации.'''
+        '''Лента кешируется, пока посты не меняют через модель.'''
         # Обращаемся к странице до изменений
         # Изменений еще нет
+        cache.clear()
         response = self.author_client.get(reverse('posts:index'))
         before_action = response.content
 
-        # Изменяем текст поста
-        CacheTest.post.text = 'Текст после изменений'
-        CacheTest.post.save()
+        # Изменяем текст поста в обход сигналов модели
+        Post.objects.filter(pk=CacheTest.post.pk).update(
+            text='Текст после изменений')
 
         # Обращаемся к странице сразу после изменений
         # Изменения не должны быть видны
@@ -403,6 +763,96 @@ class CacheTest(TestCase):
         self.assertNotEqual(before_action, after_action_and_clear_cache)
         self.assertNotEqual(after_action, after_action_and_clear_cache)
 
+    def test_cache_invalidated_on_save_and_delete(self):
+        '''Сохранение и удаление поста сразу сбрасывают кеш ленты.'''
+        cache.clear()
+        self.client.get(reverse('posts:index'))
+        post = Post.objects.get(pk=CacheTest.post.pk)
+        post.text = 'Текст после сохранения'
+        post.save()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Текст после сохранения')
+
+        post.delete()
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Текст после сохранения')
+
+    def test_cache_invalidated_on_comment(self):
+        '''Новый комментарий сразу виден на карточке в ленте.'''
+        cache.clear()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Комментариев: 0')
+        Comment.objects.create(
+            post=CacheTest.post, author=CacheTest.author, text='Коммент')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Комментариев: 1')
+
+    def test_cache_varies_on_language(self):
+        '''Для разных Accept-Language хранятся разные копии ленты.'''
+        cache.clear()
+        self.client.get(reverse('posts:index'), HTTP_ACCEPT_LANGUAGE='ru')
+        Post.objects.filter(pk=CacheTest.post.pk).update(
+            text='Текст после изменений')
+        response = self.client.get(
+            reverse('posts:index'), HTTP_ACCEPT_LANGUAGE='en-US,en;q=0.9')
+        self.assertContains(response, 'Текст после изменений')
+        response = self.client.get(
+            reverse('posts:index'), HTTP_ACCEPT_LANGUAGE='ru')
+        self.assertNotContains(response, 'Текст после изменений')
+
+    def test_cached_index_without_queries(self):
+        '''Закешированная лента отдаётся без запросов к базе.'''
+        cache.clear()
+        self.client.get(reverse('posts:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, CacheTest.post.text)
+
+
+class StaleCacheTest(SimpleTestCase):
+    '''Устаревшее значение перестраивает только один процесс.'''
+    key = 'test:stale_cache'
+
+    def setUp(self):
+        cache.clear()
+        self.builds = []
+
+    def build(self):
+        self.builds.append(True)
+        return len(self.builds)
+
+    def test_fresh_value_not_rebuilt(self):
+        self.assertEqual(cached(self.key, self.build, 60, version=1), 1)
+        self.assertEqual(cached(self.key, self.build, 60, version=1), 1)
+        self.assertEqual(len(self.builds), 1)
+
+    def test_new_version_rebuilds(self):
+        cached(self.key, self.build, 60, version=1)
+        self.assertEqual(cached(self.key, self.build, 60, version=2), 2)
+
+    def test_stale_value_while_other_rebuilds(self):
+        '''Пока блокировка занята, отдаётся прежнее значение.'''
+        cached(self.key, self.build, 0, version=1)
+        cache.add(LOCK_KEY.format(self.key), True)
+        self.assertEqual(cached(self.key, self.build, 0, version=1), 1)
+        self.assertEqual(len(self.builds), 1)
+        cache.delete(LOCK_KEY.format(self.key))
+        self.assertEqual(cached(self.key, self.build, 0, version=1), 2)
+
+    @mock.patch('posts.cache.REBUILD_WAIT', 0.1)
+    def test_old_version_never_served(self):
+        '''Сразу после смены версии прежняя копия не отдаётся.'''
+        cached(self.key, self.build, 60, version=feed_version())
+        bump_feed_version()
+        # Другой процесс уже перестраивает фрагмент новой версии
+        cache.add(LOCK_KEY.format(self.key), True)
+        self.assertEqual(
+            cached(self.key, self.build, 60, version=feed_version()), 2)
+
+    def test_expired_by_time(self):
+        cached(self.key, self.build, 0, version=1)
+        self.assertEqual(cached(self.key, self.build, 0, version=1), 2)
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class FollowViewsTest(TestCase):
@@ -516,3 +966,325 @@ class FollowViewsTest(TestCase):
         )
 
         self.assertNotIn(self.post, follow_list)
+
+    def test_new_post_fanned_out_to_followers(self):
+        '''Новый пост автора сразу записывается в ленты подписчиков.'''
+        self.creater()
+        post = Post.objects.create(
+            text='Пост после подписки', author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.no_author, post=post).exists())
+
+    def test_unfollow_trims_timeline(self):
+        '''После отписки записи автора удаляются из ленты.'''
+        self.creater()
+        self.uncreater()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.no_author).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_posts_read_on_request(self):
+        '''Посты знаменитостей не раскладываются, но видны в ленте.'''
+        self.creater()
+        post = Post.objects.create(
+            text='Пост знаменитости', author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        follow_list = (
+            self.another_client.get(reverse('posts:follow_index'))
+            .context['page_obj']
+            .object_list
+        )
+        self.assertIn(post, follow_list)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_former_celebrity_posts_stay_in_timeline(self):
+        '''Когда подписчиков стало мало, посты автора остаются в ленте.'''
+        self.creater()
+        fan = Follow.objects.create(
+            user=User.objects.create_user(username='test_fan'),
+            author=self.author,
+        )
+        post = Post.objects.create(
+            text='Пост знаменитости', author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+
+        fan.delete()
+        follow_list = (
+            self.another_client.get(reverse('posts:follow_index'))
+            .context['page_obj']
+            .object_list
+        )
+        self.assertIn(post, follow_list)
+
+
+class FeedCommentsTest(TestCase):
+    '''Карточки ленты с комментариями без N+1 запросов.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='test_author')
+        cls.group = Group.objects.create(title='Группа', slug='test_group')
+
+    def create_posts(self, count):
+        start = Post.objects.count()
+        for i in range(start, start + count):
+            post = Post.objects.create(
+                text=f'Пост {i}', author=self.author, group=self.group)
+            for j in range(3):
+                commenter = User.objects.create_user(
+                    username=f'commenter_{i}_{j}')
+                Comment.objects.create(
+                    post=post, author=commenter, text='Коммент')
+
+    def test_fixed_query_count_per_page(self):
+        '''Число запросов ленты не зависит от размера страницы.'''
+        urls = (
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+        self.create_posts(1)
+        counts = {}
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            counts[url] = len(queries)
+        self.create_posts(settings.LEN_PUBLIC_FEED - 1)
+        for url in urls:
+            with self.subTest(url=url):
+                with self.assertNumQueries(counts[url]):
+                    response = self.client.get(url)
+                self.assertEqual(
+                    len(response.context['page_obj']),
+                    settings.LEN_PUBLIC_FEED)
+
+    def test_comment_count_and_latest_commenter(self):
+        self.create_posts(2)
+        response = self.client.get(
+            reverse('posts:group_list', args=(self.group.slug,)))
+        for post in response.context['page_obj']:
+            with self.subTest(post=post.text):
+                latest = post.comments.order_by('-created', '-pk').first()
+                self.assertEqual(post.comment_count, 3)
+                self.assertEqual(
+                    post.latest_comments,
+                    [latest][:settings.FEED_LATEST_COMMENTS]
+                )
+        self.assertContains(response, 'Комментариев: 3', count=2)
+        self.assertContains(response, 'commenter_1_2')
+
+
+class FollowButtonsTest(TestCase):
+    '''Кнопки подписки в лентах без запроса на каждого автора.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='test_reader')
+        cls.group = Group.objects.create(title='Группа', slug='test_group')
+        cls.authors = [
+            User.objects.create_user(username=f'test_author_{i}')
+            for i in range(6)
+        ]
+        for author in cls.authors:
+            Post.objects.create(text='Пост', author=author, group=cls.group)
+        for author in cls.authors[:2]:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_profile_following_checks_author(self):
+        '''Флаг following относится к автору профиля.'''
+        for author, following in ((self.authors[0], True),
+                                  (self.authors[5], False)):
+            with self.subTest(author=author.username):
+                response = self.reader_client.get(
+                    reverse('posts:profile', args=(author.username,)))
+                self.assertEqual(response.context['following'], following)
+
+    def test_feed_buttons_with_one_follow_query(self):
+        url = reverse('posts:group_list', args=(self.group.slug,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(url)
+        follow_queries = [
+            query for query in queries.captured_queries
+            if 'posts_follow' in query['sql']
+        ]
+        self.assertEqual(len(follow_queries), 1)
+        self.assertContains(response, 'Отписаться', count=2)
+        self.assertContains(response, 'Подписаться', count=4)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.reader_client.get(url)
+        self.assertFalse(any(
+            'posts_follow' in query['sql']
+            for query in queries.captured_queries
+        ))
+
+    def test_follow_resets_cached_set(self):
+        url = reverse('posts:group_list', args=(self.group.slug,))
+        self.reader_client.get(url)
+        self.reader_client.get(reverse(
+            'posts:profile_follow', args=(self.authors[5].username,)))
+        response = self.reader_client.get(url)
+        self.assertContains(response, 'Отписаться', count=3)
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTest(TestCase):
+    '''Страницы для анонимов кешируются целиком, личное дорисовывается.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='test_author')
+        cls.reader = User.objects.create_user(username='test_reader')
+        cls.group = Group.objects.create(title='Группа', slug='test_group')
+        cls.post = Post.objects.create(
+            text='Закешированный пост', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_anonymous_page_served_without_queries(self):
+        for url in (reverse('posts:index'),
+                    reverse('posts:group_list', args=(self.group.slug,)),
+                    reverse('posts:profile', args=(self.author.username,)),
+                    reverse('posts:post_detail', args=(self.post.pk,)),
+                    reverse('about:author')):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.client.get(url)
+                self.assertEqual(second.content, first.content)
+                self.assertIsNone(second.context)
+                self.assertTrue(second.has_header('X-Frame-Options'))
+                not_modified = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=second['ETag'])
+                self.assertEqual(
+                    not_modified.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_cached_pages_counted_per_view(self):
+        '''Ответы из кеша страниц попадают в метрики своей view.'''
+        metrics.registry.clear()
+        for _ in range(3):
+            self.client.get(reverse('posts:index'))
+        requests = metrics.registry.histograms[
+            'yatube_request_duration_seconds']
+        self.assertEqual(requests['posts:index'].count, 3)
+        self.assertNotIn('unresolved', requests)
+
+    def test_changes_invalidate_pages(self):
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        self.client.get(url)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Новый комментарий')
+        self.assertContains(self.client.get(url), 'Новый комментарий')
+        self.client.get(reverse('posts:index'))
+        Post.objects.create(text='Свежий пост', author=self.reader)
+        self.assertContains(
+            self.client.get(reverse('posts:index')), 'Свежий пост')
+
+    def test_login_does_not_invalidate_pages(self):
+        User.objects.create_user(username='test_login', password='password')
+        url = reverse('posts:index')
+        self.client.get(url)
+        self.assertTrue(
+            Client().login(username='test_login', password='password'))
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_signup_does_not_invalidate_pages(self):
+        url = reverse('posts:group_list', args=(self.group.slug,))
+        self.client.get(url)
+        User.objects.create_user(username='test_signup')
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_user_change_invalidates_only_own_pages(self):
+        author_pages = (
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+        )
+        reader_page = reverse('posts:profile', args=(self.reader.username,))
+        for url in (*author_pages, reader_page):
+            self.client.get(url)
+        self.author.first_name = 'Переименованный'
+        self.author.save()
+        for url in author_pages:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Переименованный')
+        with self.assertNumQueries(0):
+            self.client.get(reader_page)
+
+    def test_holes_filled_for_user(self):
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.author_client.get(url)
+        self.assertFalse(any(
+            'posts_post' in query['sql']
+            for query in queries.captured_queries
+        ))
+        self.assertContains(response, 'Закешированный пост')
+        self.assertContains(response, 'test_author')
+        self.assertContains(response, 'Добавить комментарий')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, 'редактировать запись')
+        self.assertNotContains(response, '<!--hole:')
+        response = self.reader_client.get(url)
+        self.assertContains(response, 'Добавить комментарий')
+        self.assertNotContains(response, 'редактировать запись')
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Добавить комментарий')
+        self.assertNotContains(response, 'Выйти')
+
+    def test_personal_pages_rendered_for_user(self):
+        '''Кнопки подписки в карточках не дырки: страница рисуется заново.'''
+        url = reverse('posts:group_list', args=(self.group.slug,))
+        self.client.get(url)
+        response = self.reader_client.get(url)
+        self.assertIsNotNone(response.context)
+        self.assertContains(response, 'Подписаться')
+
+
+class BenchViewsCommandTest(TestCase):
+    '''Бенчмарк проходит по всем читающим view.'''
+    def test_bench_views(self):
+        author = User.objects.create_user(username='test_author')
+        reader = User.objects.create_user(username='test_reader')
+        group = Group.objects.create(title='Группа', slug='test_group')
+        Post.objects.create(text='Пост', author=author, group=group)
+        Follow.objects.create(user=reader, author=author)
+        out = StringIO()
+        call_command('bench_views', requests=1, concurrency=1, stdout=out)
+        for name in ('index', 'group_posts', 'profile', 'post_detail',
+                     'follow_index'):
+            with self.subTest(name=name):
+                self.assertIn(name, out.getvalue())
+
+
+class BenchTemplatesCommandTest(TestCase):
+    '''Бенчмарк шаблонов проходит по всем режимам загрузчика.'''
+    def test_bench_templates(self):
+        author = User.objects.create_user(username='test_author')
+        Post.objects.create(text='Пост', author=author)
+        out = StringIO()
+        call_command('bench_templates', requests=2, stdout=out)
+        output = out.getvalue()
+        for name in ('с диска', 'кеш+прогрев', 'post_detail', 'about_tech'):
+            with self.subTest(name=name):
+                self.assertIn(name, output)
+
+
+class BenchFeedCommandTest(TestCase):
+    '''Микробенчмарк ленты сравнивает {% url %} и feed_card.'''
+    def test_bench_feed(self):
+        author = User.objects.create_user(username='test_author')
+        group = Group.objects.create(title='Группа', slug='test_group')
+        Post.objects.create(text='Пост', author=author, group=group)
+        out = StringIO()
+        call_command('bench_feed', repeat=1, stdout=out)
+        self.assertIn('отрисовка', out.getvalue())
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from core.page_cache import bump_page_version
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+from posts.cache import bump_feed_version
+from posts.conditional import touch
+from posts.models import Post
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.engines.pil_engine import Engine as PILEngine
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def available_formats():
+    """Форматы из POST_IMAGE_FORMATS, которые умеет сохранять Pillow."""
+    Image.init()
+    return [fmt for fmt in settings.POST_IMAGE_FORMATS if fmt in Image.SAVE]
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (
+        image.mode in ('P', 'L') and 'transparency' in image.info)
+
+
+def flatten(image):
+    """RGB-копия изображения, прозрачное залито POST_IMAGE_BACKGROUND.
+
+    Простой convert('RGB') отбрасывает альфа-канал, и прозрачные
+    области становятся чёрными.
+    """
+    if not has_alpha(image):
+        return image.convert('RGB')
+    image = image.convert('RGBA')
+    background = Image.new(
+        'RGB', image.size, settings.POST_IMAGE_BACKGROUND)
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+class FlatteningEngine(PILEngine):
+    """Движок sorl, который не чернит прозрачное в JPEG-миниатюрах."""
+
+    def _colorspace(self, image, colorspace, format):
+        if colorspace == 'RGB' and format == 'JPEG' and has_alpha(image):
+            return flatten(image)
+        return super()._colorspace(image, colorspace, format)
+
+
+def build_variants(post):
+    """Перекодирует изображение поста в WebP/AVIF нескольких ширин.
+
+    Исходник декодируется один раз и обрезается по центру до пропорций
+    POST_THUMBNAIL_GEOMETRY. Файлы лежат в папке с хешем содержимого
+    исходника: после замены картинки у вариантов новые адреса, и
+    браузеры с прокси не отдают старые. Возвращает папку и
+    [[mime, srcset], ...].
+    """
+    formats = available_formats()
+    if not formats:
+        return None, []
+    base_width, base_height = map(
+        int, settings.POST_THUMBNAIL_GEOMETRY.split('x'))
+    widths = sorted(settings.POST_IMAGE_WIDTHS)
+    with post.image.open('rb'):
+        data = post.image.read()
+    folder = variants_folder(post.pk, hashlib.md5(data).hexdigest()[:12])
+    with Image.open(BytesIO(data)) as source:
+        source = ImageOps.fit(
+            flatten(source),
+            (widths[-1], round(widths[-1] * base_height / base_width)),
+            method=Image.LANCZOS,
+        )
+    srcsets = {fmt: [] for fmt in formats}
+    for width in widths:
+        height = round(width * base_height / base_width)
+        resized = source.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            name = f'{folder}/{width}.{fmt.lower()}'
+            # Тот же хеш — то же содержимое: файл не перезаписываем
+            if not default_storage.exists(name):
+                buffer = BytesIO()
+                resized.save(
+                    buffer, fmt, quality=settings.POST_IMAGE_QUALITY)
+                name = default_storage.save(
+                    name, ContentFile(buffer.getvalue()))
+            srcsets[fmt].append(f'{default_storage.url(name)} {width}w')
+    return folder, [
+        [Image.MIME[fmt], ', '.join(srcsets[fmt])] for fmt in formats
+    ]
+
+
+def variants_folder(post_id, digest=''):
+    return f'variants/posts/{post_id}/{digest}'.rstrip('/')
+
+
+def delete_variants(post_id, keep=None):
+    """Удаляет варианты изображения поста, кроме папки keep."""
+    root = variants_folder(post_id)
+    try:
+        folders, _ = default_storage.listdir(root)
+    except FileNotFoundError:
+        return
+    for folder in folders:
+        folder = f'{root}/{folder}'
+        if folder == keep:
+            continue
+        for name in default_storage.listdir(folder)[1]:
+            default_storage.delete(f'{folder}/{name}')
+
+
+def generate_thumbnails(post_id):
+    """Строит миниатюры поста и сохраняет их адреса в модели.
+
+    Задача для старой картинки может закончиться позже задачи для
+    новой. Поэтому адреса записываются, только если у поста всё та же
+    картинка, и только тогда удаляются варианты прежних картинок.
+    """
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None:
+        return
+    urls = {}
+    folder = None
+    if post.image:
+        for geometry, options in settings.POST_THUMBNAILS.items():
+            urls[geometry] = get_thumbnail(
+                post.image, geometry, **options).url
+        folder, urls['sources'] = build_variants(post)
+    updated = Post.objects.filter(
+        pk=post_id, image=post.image.name or '').update(
+            thumbnails=json.dumps(urls))
+    if not updated:
+        return
+    delete_variants(post_id, keep=folder)
+    bump_feed_version()
+    bump_page_version()
+    touch('post', post_id)
+    touch('user', post.author_id)
+    touch('group', post.group_id)
+
+
+def _run(post_id):
+    try:
+        generate_thumbnails(post_id)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры поста %s', post_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnails(post):
+    """Ставит построение миниатюр в очередь после коммита транзакции.
+
+    При THUMBNAIL_WORKERS = 0 миниатюры строятся сразу, в том же
+    потоке (удобно для отладки, management-команд и тестов).
+    """
+    if not settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: generate_thumbnails(post.pk))
+        return
+    transaction.on_commit(lambda: _get_executor().submit(_run, post.pk))
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.db.models import F, Q
+from posts.counters import get_counters
+from posts.models import AuthorCounters, Follow, Post, TimelineEntry
+
+# Ключ курсора ленты подписок: дата и пост берутся из TimelineEntry,
+# чтобы страница читалась по индексу (user, -pub_date, post)
+TIMELINE_KEY = ('feed_date', 'feed_post')
+
+
+def is_celebrity(author):
+    """Слишком много подписчиков, чтобы раскладывать посты по лентам."""
+    # Счётчик читаем из базы: закешированный на author объект мог
+    # устареть после сигналов в этом же запросе
+    followers = AuthorCounters.objects.filter(
+        user_id=author.pk).values_list('follower_count', flat=True).first()
+    if followers is None:
+        followers = get_counters(author).follower_count
+    return followers > settings.TIMELINE_FANOUT_LIMIT
+
+
+def fan_out_post(post):
+    """Кладёт новый пост в ленты подписчиков автора (fan-out-on-write)."""
+    if is_celebrity(post.author):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in follower_ids),
+        ignore_conflicts=True,
+    )
+
+
+def backfill(follow):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    if is_celebrity(follow.author):
+        return
+    _backfill(follow.author_id, [follow.user_id])
+
+
+def backfill_former_celebrity(author_id):
+    """Раскладывает посты автора, который перестал быть знаменитостью.
+
+    Пока подписчиков было больше TIMELINE_FANOUT_LIMIT, посты автора
+    подмешивались при чтении и в ленты не попадали. Вызывается, когда
+    после отписки подписчиков осталось ровно TIMELINE_FANOUT_LIMIT.
+    """
+    follower_ids = list(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+    _backfill(author_id, follower_ids)
+
+
+def _backfill(author_id, user_ids):
+    posts = list(Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list(
+            'pk', 'pub_date')[:settings.TIMELINE_BACKFILL_LIMIT])
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for user_id in user_ids for pk, pub_date in posts),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def trim(follow):
+    """Убирает из ленты посты автора, от которого отписались."""
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id,
+        post__author_id=follow.author_id,
+    ).delete()
+
+
+def timeline_posts(user):
+    """Посты ленты подписок пользователя.
+
+    Обычные авторы читаются из материализованной ленты, посты
+    авторов-знаменитостей подмешиваются при чтении (fan-out-on-read).
+    Сортировать и листать ленту нужно по TIMELINE_KEY.
+    """
+    celebrity_ids = list(
+        Follow.objects.filter(
+            user=user,
+            author__counters__follower_count__gt=(
+                settings.TIMELINE_FANOUT_LIMIT),
+        ).values_list('author_id', flat=True)
+    )
+    posts = Post.objects.select_related('author', 'group')
+    if not celebrity_ids:
+        return posts.filter(timeline_entries__user=user).annotate(
+            feed_date=F('timeline_entries__pub_date'),
+            feed_post=F('timeline_entries__post_id'),
+        )
+    return posts.filter(
+        Q(pk__in=TimelineEntry.objects.filter(
+            user=user).values('post_id'))
+        | Q(author_id__in=celebrity_ids)
+    ).annotate(feed_date=F('pub_date'), feed_post=F('pk'))
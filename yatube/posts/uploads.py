@@ -0,0 +1,105 @@
+from functools import wraps
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadhandler import (SkipFile,
+                                             TemporaryFileUploadHandler)
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+# Сколько первых байт файла держим в памяти, чтобы прочитать заголовок
+HEADER_MAX_SIZE = 256 * 1024
+
+
+def read_image_size(header):
+    """Размеры изображения по заголовку, без декодирования пикселей.
+
+    Возвращает None, если заголовок ещё не дочитан или не распознан.
+    Image.DecompressionBombError пробрасывается наружу.
+    """
+    try:
+        with Image.open(BytesIO(header)) as image:
+            return image.size
+    except Image.DecompressionBombError:
+        raise
+    except Exception:
+        return None
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемое изображение на диск кусками.
+
+    Файл отбрасывается, как только он превысил POST_IMAGE_MAX_SIZE
+    байт или его заголовок показал размеры больше
+    POST_IMAGE_MAX_DIMENSION. Причина отказа остаётся в errors.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.errors = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = b''
+        self.size_checked = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_SIZE:
+            self.reject(
+                'Файл слишком большой, максимум '
+                f'{filesizeformat(settings.POST_IMAGE_MAX_SIZE)}'
+            )
+        if not self.size_checked:
+            self.check_dimensions(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_dimensions(self, raw_data):
+        self.header += raw_data
+        try:
+            size = read_image_size(self.header)
+        except Image.DecompressionBombError:
+            size = None
+            self.reject('Изображение содержит слишком много пикселей')
+        if size is None and len(self.header) < HEADER_MAX_SIZE:
+            return
+        # Нераспознанный заголовок оставляем на проверку ImageField
+        self.size_checked = True
+        self.header = b''
+        limit = settings.POST_IMAGE_MAX_DIMENSION
+        if size is not None and max(size) > limit:
+            self.reject(
+                f'Изображение {size[0]}x{size[1]} слишком большое, '
+                f'стороны должны быть не больше {limit} пикселей'
+            )
+
+    def reject(self, message):
+        # Остаток файла MultiPartParser дочитает и выбросит сам
+        self.errors[self.field_name] = message
+        raise SkipFile(message)
+
+
+def stream_image_uploads(view):
+    """Подключает ImageUploadHandler к view с формой поста.
+
+    Обработчик загрузки нужно заменить до того, как CsrfViewMiddleware
+    прочитает request.POST, поэтому CSRF проверяется уже внутри.
+    """
+    protected_view = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return protected_view(request, *args, **kwargs)
+    return wrapper
+
+
+def upload_errors(request):
+    """Ошибки, с которыми обработчики загрузки отбросили файлы."""
+    errors = {}
+    for handler in request.upload_handlers:
+        errors.update(getattr(handler, 'errors', {}))
+    return errors
@@ -1,28 +1,46 @@
+from core.page_cache import cached_page, depend_on
+from core.sqlite import single_writer
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.http import HttpResponseForbidden
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import urlencode
+from posts.cache import feed_cache_context
+from posts.conditional import (conditional_page, group_objects,
+                               post_objects, profile_objects)
+from posts.counters import get_counters
+from posts.follows import follow_set
 from posts.models import Follow, Group, Post
-from posts.paginator import paginator
+from posts.paginator import comments_page, paginator
+from posts.search import search_posts
+from posts.timeline import TIMELINE_KEY, timeline_posts
+from posts.uploads import stream_image_uploads, upload_errors
 
 from .forms import CommentForm, PostForm
 
 
+@cached_page(punch_holes=True)
 def index(request):
-    posts = Post.objects.select_related('author', 'group')
-    page_obj = paginator(posts, request)
+    posts = Post.objects.for_feed()
+    # Запросы выполнятся, только если фрагмент ленты не нашёлся в кеше
+    page_obj = SimpleLazyObject(
+        lambda: paginator(posts, request, approximate=True))
 
     context = {
         'page_obj': page_obj,
-        'cache_timer': settings.CACHE_TIMER
+        'cache_timer': settings.CACHE_TIMER,
+        **feed_cache_context(request),
     }
     return render(request, 'posts/index.html', context)
 
 
+@cached_page()
+@conditional_page(group_objects)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    page_obj = paginator(group.posts.select_related('author',), request)
+    page_obj = paginator(group.posts.for_feed(), request)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -30,17 +48,29 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = paginator(search_posts(query).for_feed(), request, key=None)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@cached_page()
+@conditional_page(profile_objects)
 def profile(request, username):
-    user_obj = get_object_or_404(User, username=username)
-    posts = user_obj.posts.select_related('author', 'group')
-    page_obj = paginator(posts, request)
-    qty_posts = posts.count()
-    following = (
-        request.user.is_authenticated
-        and Follow.objects.filter(
-            author__following__user=request.user
-        ).exists()
+    user_obj = get_object_or_404(
+        User.objects.select_related('counters'),
+        username=username
     )
+    depend_on(request, f'user:{user_obj.pk}')
+    qty_posts = get_counters(user_obj).post_count
+    posts = user_obj.posts.for_feed()
+    page_obj = paginator(posts, request, count=qty_posts)
+    following = follow_set(request).is_following(user_obj)
     context = {
         'user_obj': user_obj,
         'page_obj': page_obj,
@@ -50,16 +80,19 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@cached_page(punch_holes=True)
+@conditional_page(post_objects)
 def post_detail(request, post_id):
     post = get_object_or_404(
         Post.objects
-        .select_related('author', 'group'),
+        .select_related('author__counters', 'group'),
         pk=post_id
     )
-    qty_posts = post.author.posts.count()
+    depend_on(request, f'user:{post.author_id}')
+    qty_posts = get_counters(post.author).post_count
     short_text_title = str(post)
     form = CommentForm()
-    comments = post.comments.select_related('author',)
+    comments = comments_page(post.comments.select_related('author',))
     context = {
         'post': post,
         'short_text_title': short_text_title,
@@ -71,10 +104,13 @@ def post_detail(request, post_id):
 
 
 @login_required
+@stream_image_uploads
+@single_writer
 def post_create(request):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
+        upload_errors=upload_errors(request),
     )
     if not form.is_valid():
         return render(request, 'posts/create_post.html',
@@ -86,6 +122,8 @@ def post_create(request):
 
 
 @login_required
+@stream_image_uploads
+@single_writer
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     if request.user != post.author:
@@ -96,7 +134,8 @@ def post_edit(request, post_id):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post
+        instance=post,
+        upload_errors=upload_errors(request),
     )
     if not form.is_valid():
         return render(request, 'posts/create_post.html',
@@ -106,7 +145,20 @@ def post_edit(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@conditional_page(post_objects)
+def post_comments(request, post_id):
+    """Следующая страница комментариев HTML-фрагментом для подгрузки."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments = comments_page(
+        post.comments.select_related('author',),
+        request.GET.get('cursor'),
+    )
+    return render(request, 'includes/comment_list.html',
+                  {'post': post, 'comments': comments})
+
+
 @login_required
+@single_writer
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -120,8 +172,8 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginator(posts, request)
+    posts = timeline_posts(request.user).for_feed()
+    page_obj = paginator(posts, request, key=TIMELINE_KEY)
     context = {
         'page_obj': page_obj,
     }
@@ -129,6 +181,7 @@ def follow_index(request):
 
 
 @login_required
+@single_writer
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
@@ -140,6 +193,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@single_writer
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     subscribe_obj = get_object_or_404(Follow, author=author, user=request.user)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -11,7 +12,8 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = 'r9z1rbb(l#6sfm97)bcxw+or(99vgo3&mdqc8%v#d$75%knkxn'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# В боевом окружении задаётся YATUBE_DEBUG=0
+DEBUG = os.getenv('YATUBE_DEBUG', 'true').lower() in ('1', 'true')
 
 ALLOWED_HOSTS = [
     'localhost',
@@ -40,7 +42,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.PrimaryReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.AnonymousPageMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,9 +61,35 @@ INTERNAL_IPS = [
 
 ROOT_URLCONF = 'yatube.urls'
 
+
+def user_profile_url(user):
+    from posts.links import profile_url
+    return profile_url(user.username)
+
+
+# User.get_absolute_url — страница профиля, без обхода резолвера
+ABSOLUTE_URL_OVERRIDES = {
+    'auth.user': user_profile_url,
+}
+
+# Загрузчики, которые оборачивает кешированный. Имя с префиксом проекта:
+# TEMPLATE_LOADERS — настройка, убранная из Django 1.10
+YATUBE_TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+# Кешированный загрузчик: каждый шаблон читается и разбирается один раз
+# на процесс, а wsgi.py ещё и разбирает все шаблоны из templates/ до
+# первого запроса. При DEBUG = False Django 2.2 и сам оборачивает
+# загрузчики в кешированный, так что настройка нужна для прогрева и
+# чтобы включить кеш шаблонов при DEBUG (YATUBE_CACHED_TEMPLATES=1)
+CACHED_TEMPLATES = os.getenv(
+    'YATUBE_CACHED_TEMPLATES', str(not DEBUG)).lower() in ('1', 'true')
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.metrics.TimedDjangoTemplates',
         'DIRS': [
             os.path.join(BASE_DIR, 'templates')
         ],
@@ -71,24 +102,67 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
                 'core.context_processors.my_age.my_age',
+                'posts.context_processors.follows',
             ],
         },
     },
 ]
 
+if CACHED_TEMPLATES and DEBUG:
+    # Явные loaders несовместимы с APP_DIRS
+    del TEMPLATES[0]['APP_DIRS']
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', YATUBE_TEMPLATE_LOADERS),
+    ]
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Сколько секунд держать соединение с базой открытым между запросами
+DB_CONN_MAX_AGE = int(os.getenv('YATUBE_DB_CONN_MAX_AGE', 60))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+    }
+}
+
+# Реплики только для чтения: пути к базам через запятую.
+# Локально реплики заменяют копии файла SQLite.
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+        filter(None, os.getenv('YATUBE_DB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica_{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name.strip(),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+
+# PRAGMA для каждого нового соединения с SQLite
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # мс
+    'cache_size': -20000,  # КиБ
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
 }
 
+# Выполнять view с записью по одной за раз в каждом процессе
+SQLITE_SERIALIZE_WRITES = True
+
+# Сколько секунд после записи пользователь читает с основной базы
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -145,20 +219,144 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Общий для всех процессов кеш (L2): Redis или memcached, если заданы,
+# иначе файлы в каталоге проекта (работает без сети). Тесты подменяют
+# его кешем в памяти (core.runner)
+if os.getenv('YATUBE_REDIS_URL'):
+    SHARED_CACHE = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('YATUBE_REDIS_URL'),
+    }
+elif os.getenv('YATUBE_MEMCACHED'):
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyLibMCCache',
+        'LOCATION': os.getenv('YATUBE_MEMCACHED').split(','),
+    }
+else:
+    SHARED_CACHE = {
+        # Атомарный add() нужен блокировкам перестройки (posts.cache)
+        'BACKEND': 'core.cache.AtomicFileBasedCache',
+        'LOCATION': os.getenv(
+            'YATUBE_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        # По умолчанию файлов всего 300, и при переполнении удаляется
+        # случайная треть, вместе с ключами версий и отметками изменений
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'CULL_FREQUENCY': 10,
+        },
+    }
+
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'OPTIONS': {
+            'L1': 'local',
+            'L2': 'shared',
+            # Сколько секунд процесс может видеть устаревшее значение
+            'L1_TIMEOUT': 10,
+            # Ключи версий читаются только из общего кеша
+            'SHARED_ONLY': (
+                'posts:feed_version', 'posts:modified:', 'posts:lock:',
+                'posts:following:', 'pages:version'),
+        },
+    },
+    'local': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'shared': SHARED_CACHE,
 }
 
+TEST_RUNNER = 'core.runner.LocMemCacheRunner'
+
 # Количество постов на странице (index, posts_group, author)
 LEN_PUBLIC_FEED = 10
 
+# Окно номеров страниц в пагинаторе: сколько номеров показывать
+# по сторонам от текущей страницы и в начале и конце списка
+PAGE_WINDOW_ON_EACH_SIDE = 2
+
+PAGE_WINDOW_ON_ENDS = 1
+
+# С какого числа постов главная не считает их COUNT(*), а оценивает
+APPROXIMATE_COUNT_THRESHOLD = 10000
+
+# Сколько последних комментариев показывать в карточке поста в ленте
+FEED_LATEST_COMMENTS = 1
+
+# Количество комментариев на странице поста и в каждой подгрузке
+LEN_COMMENTS_PAGE = 20
+
 # Количество символов в <title> на странице post_detail
 LEN_TITLE_POST_DETAIL = 30
 
 # Количество символов в методе __str__ модели Post
 LEN_DEF__STR__POST_MODEL = 15
 
-# Время кеширования, секунд
-CACHE_TIMER = 20
+# Время кеширования ленты, секунд.
+# Лента сбрасывается сигналами при изменении постов, поэтому TTL большой
+CACHE_TIMER = 60 * 60 * 3
+
+# Кеш целых страниц для анонимов (core.page_cache). В DEBUG выключен,
+# чтобы правки шаблонов и debug toolbar были видны сразу
+# (включить можно и при DEBUG: YATUBE_PAGE_CACHE=1)
+PAGE_CACHE_ENABLED = os.getenv(
+    'YATUBE_PAGE_CACHE', str(not DEBUG)).lower() in ('1', 'true')
+
+# Время кеширования страницы, секунд. Страницы сбрасываются сигналами
+PAGE_CACHE_TIMER = 60 * 10
+
+# Сколько секунд после CACHE_TIMER можно отдавать устаревшую ленту,
+# пока один процесс её перестраивает
+CACHE_STALE_TIMER = 60
+
+# Авторы с большим числом подписчиков не раскладываются по лентам
+# подписок при публикации, их посты подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Сколько последних постов автора попадает в ленту при подписке
+TIMELINE_BACKFILL_LIMIT = 500
+
+# Миниатюры Post.image строятся заранее, при сохранении PostForm.
+# Ключ — геометрия sorl-thumbnail, значение — её параметры
+POST_THUMBNAILS = {
+    '960x339': {'crop': 'center', 'upscale': True},
+}
+
+# Геометрия миниатюры в ленте и на странице поста
+POST_THUMBNAIL_GEOMETRY = '960x339'
+
+# Ширины и форматы (в порядке предпочтения) вариантов изображения для
+# <picture>/srcset. Форматы, которых нет в сборке Pillow, пропускаются
+POST_IMAGE_WIDTHS = (320, 640, 960)
+
+POST_IMAGE_FORMATS = ('AVIF', 'WEBP')
+
+POST_IMAGE_QUALITY = 80
+
+# Фон, на который кладутся прозрачные картинки в миниатюрах и вариантах
+POST_IMAGE_BACKGROUND = '#ffffff'
+
+# Движок sorl-thumbnail: прозрачные картинки не чернеют в JPEG
+THUMBNAIL_ENGINE = 'posts.thumbnails.FlatteningEngine'
+
+# Потоков в пуле построения миниатюр; 0 — строить в том же потоке
+THUMBNAIL_WORKERS = 2
+
+# Ограничения загружаемых изображений постов: байты и пиксели по
+# большей стороне. Проверяются потоково, до полного чтения файла
+POST_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+POST_IMAGE_MAX_DIMENSION = 8000
+
+# Адреса, с которых Prometheus может забирать /metrics
+METRICS_ALLOWED_IPS = os.getenv(
+    'YATUBE_METRICS_IPS', '127.0.0.1').split(',')
+
+# Доля запросов, которые профилируются cProfile (0 — не профилировать),
+# и каталог для дампов .prof
+METRICS_PROFILE_RATE = float(os.getenv('YATUBE_PROFILE_RATE', 0))
+
+METRICS_PROFILE_DIR = os.getenv(
+    'YATUBE_PROFILE_DIR',
+    os.path.join(tempfile.gettempdir(), 'yatube_profiles'),
+)
@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
+from core.warmup import warm_up_templates
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# Шаблоны разбираются до первого запроса, а с --preload у gunicorn
+# ещё и один раз на все воркеры
+if settings.CACHED_TEMPLATES:
+    warm_up_templates()